@@ -0,0 +1,216 @@
+"""
+Function composition without one nested frame per function.
+
+compose(f, g) in higher order function.py returns `lambda x: f(g(x))`.
+Composing K functions that way nests K lambdas: every call goes K+1 frames
+deep, and a long enough chain raises RecursionError.
+
+Composed keeps the functions in one flat tuple, in the order they run, and
+composing a Composed with anything just concatenates the tuples. Calling it
+runs a single generated function with one line per step, so a call is one
+frame however long the chain is. Functions with a map Kernel from stream.py
+(square) are inlined as expressions instead of called.
+
+Steps that are affine, x -> a * x + b, are folded together first:
+multiplier(2) then multiplier(3) becomes one `x * 6`, add_one then
+multiply_by_two becomes `x * 2 + 2`. A function is affine if it has an
+`affine = (a, b)` attribute: multiplier(n) from stream.py has one, and
+@affine(a, b) adds one. Folding is exact for integers; with floats
+(x * a) * b and x * (a * b) can round differently in the last digit, so
+pass fold=False if that matters.
+
+    new_function = compose(add_one, multiply_by_two)    # same order as before
+    new_function(3)                                     # 7
+    long = compose(*[multiplier(2)] * 5000)             # no RecursionError, one multiply
+    new_function.map([1, 2, 3])                         # whole batch in one call
+
+map() runs the chain over a batch: vectorized with numpy when every step is
+affine or has a Kernel from stream.py, otherwise one Python loop over the
+values with the steps inlined.
+"""
+import itertools
+
+from stream import Kernel, multiplier, square
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_counter = itertools.count()
+
+
+def affine(a, b=0):
+    """Marks a function as x -> a * x + b so Composed can fold it."""
+    def decorator(func):
+        func.affine = (a, b)
+        return func
+    return decorator
+
+
+@affine(1, 1)
+def add_one(x):
+    return x + 1
+
+
+@affine(2, 0)
+def multiply_by_two(x):
+    return x * 2
+
+
+def _fold(steps):
+    """Merges runs of affine steps into one (a, b) pair each."""
+    folded = []
+    for step in steps:
+        current = getattr(step, "affine", None) if callable(step) else step
+        if current is not None and folded and isinstance(folded[-1], tuple):
+            a1, b1 = folded[-1]
+            a2, b2 = current
+            folded[-1] = (a1 * a2, a2 * b1 + b2)
+        elif current is not None:
+            folded.append(tuple(current))
+        else:
+            folded.append(step)
+    return [s for s in folded if s != (1, 0)]
+
+
+class Composed:
+    def __init__(self, steps, fold=True):
+        self.steps = tuple(steps)           # in the order they run
+        self.fold = fold
+        self._plan = _fold(self.steps) if fold else list(self.steps)
+        self._call = self._compile()
+
+    def __call__(self, x):
+        return self._call(x)
+
+    def then(self, *funcs):
+        """A new Composed that runs `funcs` after this one."""
+        return compose(*reversed(funcs), self, fold=self.fold)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def _compile(self):
+        namespace = {}
+        lines = ["def composed(x):"]
+        for step in self._plan:
+            if isinstance(step, tuple):
+                a, b = step
+                names = []
+                for value in (a, b):
+                    names.append("_c{}".format(next(_counter)))
+                    namespace[names[-1]] = value
+                if b == 0:
+                    lines.append("    x = x * {}".format(names[0]))
+                elif a == 1:
+                    lines.append("    x = x + {}".format(names[1]))
+                else:
+                    lines.append("    x = x * {} + {}".format(*names))
+            elif self.fold and isinstance(getattr(step, "kernel", None), Kernel) and step.kernel.kind == "map":
+                kernel = step.kernel
+                constants = {}
+                for key, value in kernel.constants.items():
+                    constants[key] = "_c{}".format(next(_counter))
+                    namespace[constants[key]] = value
+                lines.append("    x = " + kernel.scalar.format("x", **constants))
+            else:
+                name = "_f{}".format(next(_counter))
+                namespace[name] = step
+                lines.append("    x = {}(x)".format(name))
+        lines.append("    return x")
+        self.source = "\n".join(lines) + "\n"
+        exec(compile(self.source, "<composed>", "exec"), namespace)
+        return namespace["composed"]
+
+    def _vector_steps(self):
+        steps = []
+        for step in self._plan:
+            if isinstance(step, tuple):
+                a, b = step
+                steps.append(lambda v, a=a, b=b: v * a + b if b != 0 else v * a)
+                continue
+            kernel = getattr(step, "kernel", None)
+            if not isinstance(kernel, Kernel) or kernel.kind != "map":
+                return None
+            steps.append(kernel.vector)
+        return steps
+
+    def map(self, values):
+        """Applies the whole chain to every value; a numpy array in, a numpy array out."""
+        if np is not None and isinstance(values, np.ndarray) and values.dtype.kind == "f":
+            steps = self._vector_steps()
+            if steps is not None:
+                for step in steps:
+                    values = step(values)
+                return values
+        call = self._call
+        if np is not None and isinstance(values, np.ndarray):
+            # integers go through Python so they can't wrap around in int64
+            return np.array([call(x) for x in values.tolist()])
+        return [call(x) for x in values]
+
+    def __repr__(self):
+        return "Composed({})".format(", ".join(getattr(f, "__name__", repr(f)) for f in self.steps))
+
+
+def compose(*funcs, fold=True):
+    """compose(f, g, h)(x) == f(g(h(x))), like compose(f, g) in higher order function.py."""
+    steps = []
+    for func in reversed(funcs):
+        if isinstance(func, Composed):
+            steps.extend(func.steps)
+        else:
+            steps.append(func)
+    return Composed(steps, fold)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    def old_compose(f, g):
+        return lambda x: f(g(x))
+
+    new_function = compose(add_one, multiply_by_two)
+    print(new_function(3))          # (3 * 2) + 1 = 7
+    print(compose(square, multiplier(2), multiplier(3)).source)
+
+    def nested(funcs):
+        composed = funcs[0]
+        for f in funcs[1:]:
+            composed = old_compose(composed, f)
+        return composed
+
+    chain = [multiplier(2), add_one, multiplier(3), multiply_by_two, square, add_one] * 4
+    old, new = nested(chain), compose(*chain)
+    unfolded = compose(*chain, fold=False)
+    assert old(7) == new(7) == unfolded(7)
+
+    n = 200000
+    for label, f in (("nested lambdas", old), ("Composed, fold=False", unfolded), ("Composed", new)):
+        start = time.perf_counter()
+        for x in range(n):
+            f(x)
+        print("{:<22} {} steps: {:.2f} us per call".format(
+            label, len(chain), (time.perf_counter() - start) / n * 1e6))
+
+    try:
+        nested([multiplier(2)] * (sys.getrecursionlimit() + 10))(1)
+    except RecursionError:
+        print("nested lambdas: RecursionError at {} steps".format(sys.getrecursionlimit() + 10))
+    long = compose(*[multiplier(2)] * 5000)
+    print("Composed, 5000 x multiplier(2):", long(1) == 2 ** 5000, long.source.count("\n") - 2, "line(s)")
+
+    if np is not None:
+        values = np.random.default_rng(0).random(10 ** 6)
+        chain = [multiplier(2.0), add_one, square, multiplier(0.5)]
+        f = compose(*chain)
+        start = time.perf_counter()
+        looped = [f(x) for x in values.tolist()]
+        per_value = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = f.map(values)
+        print("1M values: {:.3f}s calling per value, {:.3f}s with map()".format(
+            per_value, time.perf_counter() - start))
+        assert np.allclose(batch, looped)
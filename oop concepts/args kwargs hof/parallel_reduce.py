@@ -0,0 +1,201 @@
+"""
+reduce() for associative operators, spread over worker processes.
+
+reduce(add, numbers) in higher order function.py is a left fold,
+((1 + 2) + 3) + 4 ..., on one core, and it needs the whole input to exist.
+When the operator is associative, (a + b) + c == a + (b + c), the input can be
+cut into chunks, each chunk reduced on its own core, and the partial results
+combined afterwards in any grouping.
+
+An Associative says how:
+
+    chunk(values)         -> one partial result from a list of input values
+                             (defaults to reduce(combine, values))
+    combine(left, right)  -> merges two partial results; must be associative
+    commutative=True      -> the partial results may also be merged out of
+                             order, as soon as workers finish
+
+    SUM, MAX, MIN, UNION (of sets) and HISTOGRAM (counts of the values) are
+    ready-made.
+
+    parallel_reduce(SUM, range(10**9))
+    parallel_reduce(HISTOGRAM, read_words(path), chunk_size=50000)
+
+- The input is read lazily, chunk_size values at a time, and at most
+  max_pending chunks are ever in flight (2 per worker by default), so memory
+  stays bounded however long the input is. Ranges are sent as sub-ranges,
+  which pickle to a few bytes instead of a list.
+- Partial results are merged as a balanced tree: a stack holding one partial
+  per power-of-two run of chunks, like a binary counter, so only O(log n)
+  partials are kept, and a non-commutative operator still sees its chunks
+  left to right.
+- chunk and combine run in worker processes, so they must be module-level
+  functions (picklable). workers=0 runs everything in this process.
+"""
+import collections
+import concurrent.futures
+import copy
+import functools
+import itertools
+import operator
+import os
+
+from parallel_repeat import _pool
+
+_MISSING = object()
+
+
+class Associative:
+    def __init__(self, combine, identity=_MISSING, commutative=False, chunk=None, name=None):
+        self.combine = combine
+        self.identity = identity
+        self.commutative = commutative
+        self.chunk = chunk
+        self.name = name or getattr(combine, "__name__", "operator")
+
+    def reduce_chunk(self, values):
+        if self.chunk is not None:
+            return self.chunk(values)
+        return functools.reduce(self.combine, values)
+
+    def __repr__(self):
+        return "Associative({}{})".format(self.name, ", commutative" if self.commutative else "")
+
+
+def _union(values):
+    return set().union(*values)
+
+
+def _count(values):
+    return collections.Counter(values)
+
+
+def _merge_counts(left, right):
+    merged = collections.Counter(left)
+    merged.update(right)
+    return merged
+
+
+SUM = Associative(operator.add, 0, commutative=True, chunk=sum, name="sum")
+MAX = Associative(max, commutative=True, chunk=max, name="max")
+MIN = Associative(min, commutative=True, chunk=min, name="min")
+UNION = Associative(operator.or_, set(), commutative=True, chunk=_union, name="union")
+HISTOGRAM = Associative(_merge_counts, collections.Counter(), commutative=True, chunk=_count, name="histogram")
+
+
+def _chunks(values, size):
+    if isinstance(values, range):
+        for start in range(0, len(values), size):
+            yield values[start:start + size]
+        return
+    iterator = iter(values)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _reduce_chunk(op, chunk):
+    return op.reduce_chunk(chunk)
+
+
+class _Tree:
+    """Merges partial results pairwise, keeping one per power-of-two run."""
+
+    def __init__(self, combine):
+        self.combine = combine
+        self.stack = []     # (number of chunks covered, partial), oldest first
+
+    def push(self, value):
+        size = 1
+        while self.stack and self.stack[-1][0] == size:
+            _, left = self.stack.pop()
+            value = self.combine(left, value)
+            size *= 2
+        self.stack.append((size, value))
+
+    def result(self):
+        if not self.stack:
+            return _MISSING
+        value = self.stack[-1][1]
+        for _, left in reversed(self.stack[:-1]):
+            value = self.combine(left, value)
+        return value
+
+
+def parallel_reduce(op, values, workers=None, chunk_size=100000, max_pending=None):
+    if not isinstance(op, Associative):
+        raise TypeError("parallel_reduce needs an Associative, e.g. Associative(func, commutative=True)")
+    tree = _Tree(op.combine)
+    if workers == 0:
+        for chunk in _chunks(values, chunk_size):
+            tree.push(op.reduce_chunk(chunk))
+    else:
+        workers = workers or os.cpu_count() or 1
+        max_pending = max_pending or 2 * workers
+        pool = _pool("process", workers)
+        if op.commutative:
+            pending = set()
+            for chunk in _chunks(values, chunk_size):
+                pending.add(pool.submit(_reduce_chunk, op, chunk))
+                if len(pending) >= max_pending:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        tree.push(future.result())
+            for future in concurrent.futures.as_completed(pending):
+                tree.push(future.result())
+        else:
+            # keep submit order, so every merge is (earlier chunks, later chunks)
+            pending = collections.deque()
+            for chunk in _chunks(values, chunk_size):
+                pending.append(pool.submit(_reduce_chunk, op, chunk))
+                if len(pending) >= max_pending:
+                    tree.push(pending.popleft().result())
+            while pending:
+                tree.push(pending.popleft().result())
+
+    result = tree.result()
+    if result is _MISSING:
+        if op.identity is _MISSING:
+            raise TypeError("parallel_reduce() of empty input with no identity")
+        # a copy: UNION's set() and HISTOGRAM's Counter() are shared by every call
+        return copy.copy(op.identity)
+    return result
+
+
+def _concat(left, right):
+    return left + right
+
+
+CONCAT = Associative(_concat, "", name="concat")   # associative, not commutative
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from functools import reduce
+
+    n = 2 * 10 ** 7
+    print("{} core(s)".format(os.cpu_count()))
+
+    start = time.perf_counter()
+    expected = reduce(operator.add, range(n))
+    print("reduce(add, range({:,})):     {:.2f}s".format(n, time.perf_counter() - start))
+    for workers in (0, 1, 2, 4):
+        start = time.perf_counter()
+        total = parallel_reduce(SUM, range(n), workers=workers, chunk_size=10 ** 6)
+        assert total == expected
+        print("parallel_reduce(SUM, workers={}): {:.2f}s".format(workers, time.perf_counter() - start))
+
+    rng = random.Random(4)
+    words = (rng.choice(["apple", "pear", "plum", "fig"]) for _ in range(10 ** 6))
+    counts = parallel_reduce(HISTOGRAM, words, chunk_size=50000)
+    print("histogram of 1M streamed words:", dict(sorted(counts.items())))
+    print("max of a generator:", parallel_reduce(MAX, (x * 7919 % 1000003 for x in range(10 ** 6))))
+    print("union:", sorted(parallel_reduce(UNION, ({i % 10} for i in range(1000)), chunk_size=64)))
+
+    letters = [chr(ord("a") + i % 26) for i in range(5000)]
+    assert parallel_reduce(CONCAT, letters, chunk_size=7) == "".join(letters)
+    print("non-commutative concat kept its order over {} chunks".format(-(-len(letters) // 7)))
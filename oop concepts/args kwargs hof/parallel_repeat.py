@@ -0,0 +1,162 @@
+"""
+repeat(n) that fans the calls out to a pool and keeps every result.
+
+repeat(n) in higher order function.py and args kwargs.py calls the function
+n times one after the other and throws every return value away (the wrapper
+doesn't even return the last one). For load generation and Monte-Carlo runs
+we want all n results, and we want them in parallel.
+
+    @repeat(1000)                        # threads by default
+    def roll():
+        return random.randint(1, 6)
+
+    run = roll()                         # RepeatResult
+    run.results                          # 1000 values, in call order
+    run.wall_time, run.latency()         # seconds, p50 / p90 / p99 / max per call
+
+    roll.run("process")                  # same thing on a process pool, this call only
+
+Threads are right for I/O bound functions (they release the GIL while they
+wait), processes for CPU bound ones. The pools are created once and reused.
+"""
+import atexit
+import concurrent.futures
+import functools
+import importlib
+import multiprocessing
+import os
+import random
+import statistics
+import time
+
+_pools = {}
+
+
+def _pool(kind, workers):
+    key = (kind, workers)
+    pool = _pools.get(key)
+    if pool is None:
+        if kind == "thread":
+            pool = concurrent.futures.ThreadPoolExecutor(workers)
+        elif kind == "process":
+            pool = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            raise ValueError("executor must be 'thread' or 'process', not {!r}".format(kind))
+        _pools[key] = pool
+    return pool
+
+
+@atexit.register
+def shutdown():
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
+
+
+def _timed_call(func, args, kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _timed_call_by_name(module, qualname, args, kwargs):
+    # the decorated name now points at the wrapper, so a process worker looks
+    # it up and calls the original function behind it
+    target = importlib.import_module(module)
+    for part in qualname.split("."):
+        target = getattr(target, part)
+    return _timed_call(target.__wrapped__, args, kwargs)
+
+
+def _check_importable(func):
+    """Process workers find the function by module and name; fail here, not in every worker."""
+    name = "{}.{}".format(func.__module__, func.__qualname__)
+    if "<locals>" in func.__qualname__ or "<lambda>" in func.__qualname__:
+        raise ValueError("{} is defined inside a function, so process workers can't import it; "
+                         "define it at module level".format(name))
+    if func.__module__ == "__main__" and multiprocessing.get_start_method() != "fork":
+        raise ValueError("{} is defined in __main__, which process workers don't see with the {!r} "
+                         "start method; move it to a module".format(name, multiprocessing.get_start_method()))
+
+
+class RepeatResult:
+    def __init__(self, results, latencies, wall_time, executor):
+        self.results = results
+        self.latencies = latencies
+        self.wall_time = wall_time
+        self.executor = executor
+
+    def latency(self):
+        """p50 / p90 / p99 / max of the per call times, in seconds."""
+        ordered = sorted(self.latencies)
+        if len(ordered) < 2:
+            value = ordered[0] if ordered else 0.0
+            return {"p50": value, "p90": value, "p99": value, "max": value}
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+        return {"p50": cuts[49], "p90": cuts[89], "p99": cuts[98], "max": ordered[-1]}
+
+    def __repr__(self):
+        lat = self.latency()
+        return "<RepeatResult {} calls on {} pool in {:.3f}s, p50 {:.2f}ms p99 {:.2f}ms>".format(
+            len(self.results), self.executor, self.wall_time, lat["p50"] * 1000, lat["p99"] * 1000)
+
+
+def repeat(n, executor="thread", workers=None):
+    def decorator(func):
+        def run(mode, /, *args, **kwargs):
+            # positional-only, so the function can have its own `mode` keyword
+            size = workers
+            if size is None:
+                # threads mostly wait, so use more of them than there are cores
+                size = min(32, n) if mode == "thread" else min(n, os.cpu_count() or 1)
+            pool = _pool(mode, size)
+            start = time.perf_counter()
+            if mode == "process":
+                _check_importable(func)
+                futures = [pool.submit(_timed_call_by_name, func.__module__, func.__qualname__,
+                                       args, kwargs) for _ in range(n)]
+            else:
+                futures = [pool.submit(_timed_call, func, args, kwargs) for _ in range(n)]
+            # futures are kept in submit order, so the results are too
+            done = [f.result() for f in futures]
+            wall_time = time.perf_counter() - start
+            return RepeatResult([r for r, _ in done], [t for _, t in done], wall_time, mode)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return run(executor, *args, **kwargs)
+
+        wrapper.run = run
+        return wrapper
+    return decorator
+
+
+@repeat(200)
+def slow_lookup(key):
+    # I/O bound: sleeps like a network call
+    time.sleep(0.01)
+    return key * 2
+
+
+@repeat(8)
+def monte_carlo_pi(samples):
+    # CPU bound
+    inside = sum(1 for _ in range(samples) if random.random() ** 2 + random.random() ** 2 <= 1)
+    return 4 * inside / samples
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    for _ in range(200):
+        time.sleep(0.01)
+    print("sequential repeat(200) of a 10ms call: {:.2f}s".format(time.perf_counter() - start))
+
+    run = slow_lookup(21)
+    assert run.results == [42] * 200
+    print(run)
+
+    # imported by module name, so process workers can find it under any start method
+    from parallel_repeat import monte_carlo_pi
+    for mode in ("thread", "process"):
+        run = monte_carlo_pi.run(mode, 200000)
+        print(run, "pi ~ {:.4f}".format(sum(run.results) / len(run.results)))
@@ -0,0 +1,354 @@
+"""
+Lazy map / filter / reduce, run as one loop.
+
+higher order function.py shows
+
+    reduce(add, filter(is_even, map(square, numbers)))
+
+Each stage is a separate iterator and every element pays a Python call to
+square, to is_even and to add, plus the iterator hand-offs between them.
+
+Stream records the chain and runs nothing until a terminal call
+(reduce / sum / to_list / iteration):
+
+    Stream(range(10**8)).map(square).filter(is_even).reduce(add)
+
+and then picks one of two backends:
+
+    numpy  -> when the source is numeric (range, ndarray, array.array, list of
+              numbers) and every step is a function it knows (square, is_even,
+              add, multiplier(n), max, min). The source is cut into chunks of
+              CHUNK values and each step is one vectorized expression per
+              chunk, so memory stays at a few chunks however long the input.
+              Integer results are kept exact: the largest possible value is
+              worked out before running, and anything that could overflow
+              int64 goes to the python backend instead. Sums that could
+              overflow are done as two half-width sums.
+    python -> a single generated loop. Known functions are inlined as
+              expressions (`x = x * x`, `if x % 2: continue`), anything else
+              is called as usual.
+
+Float sums on the numpy backend are added pairwise, not strictly left to
+right, so the last digits can differ from reduce(). Pass backend="python"
+to force the exact left fold.
+
+A function becomes "known" by giving it a Kernel (see square below), the
+same idea as the Constraint templates in validators.py.
+
+Run `python stream.py` for the 10**8 element benchmark.
+"""
+import itertools
+import operator
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK = 1 << 20
+_INT64_MAX = 2 ** 63 - 1
+_MISSING = object()
+_counter = itertools.count()
+
+
+class Kernel:
+    """How to run a function inline (scalar template) and over a whole chunk (vector)."""
+
+    def __init__(self, kind, scalar, vector, bound=None, integer=True, **constants):
+        self.kind = kind            # "map", "filter" or "reduce"
+        self.scalar = scalar        # "{0} * {0}", reducers use {0} and {1}
+        self.vector = vector        # chunk -> chunk / mask / reduced value
+        self.bound = bound          # largest |result| from largest |input|, None = unchanged
+        self.integer = integer      # int input stays int
+        self.constants = constants
+
+
+def kernel(kind, scalar, vector, bound=None, integer=True, **constants):
+    def decorator(func):
+        func.kernel = Kernel(kind, scalar, vector, bound, integer, **constants)
+        return func
+    return decorator
+
+
+@kernel("map", "{0} * {0}", lambda a: a * a, bound=lambda b: b * b)
+def square(x):
+    return x * x
+
+
+@kernel("filter", "{0} % 2 == 0", lambda a: a % 2 == 0)
+def is_even(n):
+    return n % 2 == 0
+
+
+def _exact_sum(a, bound):
+    if not len(a):
+        return _MISSING
+    if a.dtype.kind == "f":
+        return float(a.sum())
+    if bound * len(a) <= _INT64_MAX:
+        return int(a.sum())
+    # x == (x >> 32) * 2**32 + (x & 0xFFFFFFFF) for every int64, and neither
+    # half can overflow when summed over fewer than 2**31 values
+    high, low = a >> 32, a & 0xFFFFFFFF
+    return (int(high.sum()) << 32) + int(low.sum())
+
+
+@kernel("reduce", "{0} + {1}", _exact_sum)
+def add(x, y):
+    return x + y
+
+
+def multiplier(n):
+    @kernel("map", "{0} * {n}", lambda a: a * n, bound=lambda b: b * abs(n), integer=isinstance(n, int), n=n)
+    def multiply(x):
+        return x * n
+    multiply.affine = (n, 0)    # x * n + 0, for compose.py
+    return multiply
+
+
+def _item(a, pick):
+    return pick(a).item() if len(a) else _MISSING
+
+
+_KNOWN = {
+    operator.add: add.kernel,
+    max: Kernel("reduce", "{1} if {1} > {0} else {0}", lambda a, bound: _item(a, np.max)),
+    min: Kernel("reduce", "{1} if {1} < {0} else {0}", lambda a, bound: _item(a, np.min)),
+}
+
+
+def _kernel_of(func):
+    return getattr(func, "kernel", None) or _KNOWN.get(func)
+
+
+class Stream:
+    def __init__(self, source, backend=None):
+        if backend not in (None, "python", "numpy"):
+            raise ValueError("backend must be None, 'python' or 'numpy'")
+        self._source = source
+        self._steps = ()
+        self.backend = backend
+
+    def _then(self, kind, func):
+        stream = Stream(self._source, self.backend)
+        stream._steps = self._steps + ((kind, func),)
+        return stream
+
+    def map(self, func):
+        return self._then("map", func)
+
+    def filter(self, func):
+        return self._then("filter", func)
+
+    # -- terminal calls ---------------------------------------------------
+
+    def reduce(self, func, initial=_MISSING):
+        plan = self._plan(func)
+        if plan is not None:
+            acc = initial
+            for part in self._run_numpy(plan, func):
+                if part is not _MISSING:
+                    acc = part if acc is _MISSING else func(acc, part)
+        else:
+            run = self._compile("reduce", func)
+            acc, started = run(self._python_source(), initial, initial is not _MISSING)
+            if not started:
+                acc = _MISSING
+        if acc is _MISSING:
+            raise TypeError("reduce() of empty stream with no initial value")
+        return acc
+
+    def sum(self, start=0):
+        return self.reduce(add, start)
+
+    def to_list(self):
+        plan = self._plan(None)
+        if plan is not None:
+            parts = list(self._run_numpy(plan, None))
+            return np.concatenate(parts).tolist() if parts else []
+        return self._compile("list")(self._python_source())
+
+    def __iter__(self):
+        return self._compile("iter")(self._python_source())
+
+    def explain(self):
+        """Which backend would run, and the generated loop for the python one."""
+        if self._plan(None) is not None:
+            return "numpy: " + " -> ".join("{}({})".format(kind, getattr(f, "__name__", f))
+                                          for kind, f in self._steps)
+        return "python:\n" + self._source_code("list")[0]
+
+    # -- numpy backend --------------------------------------------------------
+
+    def _plan(self, reducer):
+        """(steps as kernels, integer bound) if the numpy backend can run this exactly, else None."""
+        if np is None or self.backend == "python":
+            return None
+        kinds = [kind for kind, _ in self._steps]
+        kernels = [_kernel_of(f) for _, f in self._steps]
+        if reducer is not None:
+            kinds.append("reduce")
+            kernels.append(_kernel_of(reducer))
+        if any(k is None or k.kind != kind for k, kind in zip(kernels, kinds)):
+            return self._refuse("a step has no Kernel of its kind")
+        source = self._source
+        if isinstance(source, range):
+            integer = True
+            bound = max(abs(source.start), abs(source[-1])) if len(source) else 0
+        else:
+            a = self._as_array(source)
+            if a is None:
+                return self._refuse("source is not numeric")
+            integer = a.dtype.kind in "biu"
+            bound = max(abs(int(a.min())), abs(int(a.max()))) if integer and len(a) else 0
+        if bound > _INT64_MAX:
+            return self._refuse("values don't fit in int64")
+        for kernel in kernels[:len(self._steps)]:
+            if integer:
+                if kernel.bound is not None:
+                    bound = kernel.bound(bound)
+                integer = kernel.integer
+                if integer and bound > _INT64_MAX:
+                    return self._refuse("values could overflow int64")
+        return kernels[:len(self._steps)], bound if integer else 0
+
+    def _refuse(self, reason):
+        if self.backend == "numpy":
+            raise ValueError("numpy backend can't run this stream: " + reason)
+        return None
+
+    @staticmethod
+    def _as_array(source):
+        if isinstance(source, np.ndarray):
+            a = source
+        elif isinstance(source, array):
+            a = np.asarray(memoryview(source)) if len(source) else np.array([], source.typecode)
+        elif isinstance(source, (list, tuple)):
+            a = np.asarray(source)
+        else:
+            return None
+        if a.dtype.kind not in "biuf" or a.ndim != 1:
+            return None
+        if a.dtype.kind == "b":
+            a = a.astype(np.int64)     # True * True is 1 in Python, not True
+        elif a.dtype.kind in "iu" and a.dtype != np.int64:
+            # uint8 200 squared would wrap to 64; the bounds are worked out for int64.
+            # uint64 above int64's range stays as it is and _plan refuses it
+            if not (a.dtype == np.uint64 and len(a) and int(a.max()) > _INT64_MAX):
+                a = a.astype(np.int64)
+        return a
+
+    def _chunks(self):
+        source = self._source
+        if isinstance(source, range):
+            for start in range(0, len(source), CHUNK):
+                part = source[start:start + CHUNK]
+                yield np.arange(part.start, part.stop, part.step, dtype=np.int64)
+        else:
+            a = self._as_array(source)
+            for start in range(0, len(a), CHUNK):
+                yield a[start:start + CHUNK]
+
+    def _run_numpy(self, plan, reducer):
+        kernels, bound = plan
+        steps = [(kind, k.vector) for (kind, _), k in zip(self._steps, kernels)]
+        reduce_chunk = _kernel_of(reducer).vector if reducer is not None else None
+        for a in self._chunks():
+            for kind, vector in steps:
+                a = vector(a) if kind == "map" else a[vector(a)]
+            yield reduce_chunk(a, bound) if reduce_chunk is not None else a
+
+    # -- python backend -------------------------------------------------------
+
+    def _python_source(self):
+        source = self._source
+        if np is not None and isinstance(source, np.ndarray):
+            # plain Python numbers, so integers grow instead of wrapping around
+            return itertools.chain.from_iterable(
+                source[start:start + CHUNK].tolist() for start in range(0, len(source), CHUNK))
+        return source
+
+    def _expression(self, func, kind, args, namespace):
+        k = _kernel_of(func)
+        if k is None or k.kind != kind:
+            # e.g. max used as a map step: its kernel is the two-argument reduce
+            # form, so call the function itself
+            name = "_f{}".format(next(_counter))
+            namespace[name] = func
+            return "{}({})".format(name, ", ".join(args))
+        constants = {}
+        for key, value in k.constants.items():
+            constants[key] = "_c{}".format(next(_counter))
+            namespace[constants[key]] = value
+        return "(" + k.scalar.format(*args, **constants) + ")"
+
+    def _source_code(self, mode, reducer=None):
+        namespace = {}
+        lines = ["def run(_source, _acc=None, _started=False):"]
+        if mode == "list":
+            lines += ["    _out = []", "    _append = _out.append"]
+        lines.append("    for x in _source:")
+        for kind, func in self._steps:
+            expr = self._expression(func, kind, ["x"], namespace)
+            if kind == "map":
+                lines.append("        x = {}".format(expr))
+            else:
+                lines.append("        if not {}: continue".format(expr))
+        if mode == "reduce":
+            lines += ["        if _started:",
+                      "            _acc = {}".format(self._expression(reducer, "reduce", ["_acc", "x"], namespace)),
+                      "        else:",
+                      "            _acc, _started = x, True",
+                      "    return _acc, _started"]
+        elif mode == "list":
+            lines += ["        _append(x)", "    return _out"]
+        else:
+            lines.append("        yield x")
+        return "\n".join(lines) + "\n", namespace
+
+    def _compile(self, mode, reducer=None):
+        code, namespace = self._source_code(mode, reducer)
+        exec(compile(code, "<stream>", "exec"), namespace)
+        return namespace["run"]
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from functools import reduce
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 8
+    m = min(n, 10 ** 7)    # the pure Python runs use at most 10**7 and are scaled up
+
+    def timed(label, work, size):
+        start = time.perf_counter()
+        result = work()
+        elapsed = time.perf_counter() - start
+        scale = n / size
+        note = "" if size == n else "  (measured on {:,}, scaled x{:g})".format(size, scale)
+        print("{:<44} {:>8.2f}s{}".format(label, elapsed * scale, note))
+        return result
+
+    print("sum of the even squares of range({:,})".format(n))
+    expected = timed("reduce(add, filter(is_even, map(square, ..)))",
+                     lambda: reduce(add, filter(is_even, map(square, range(m)))), m)
+    got = timed("Stream, python backend (one fused loop)",
+                lambda: Stream(range(m), backend="python").map(square).filter(is_even).reduce(add), m)
+    assert got == expected
+    if np is not None:
+        assert Stream(range(m)).map(square).filter(is_even).reduce(add) == expected
+        timed("Stream, numpy backend",
+              lambda: Stream(range(n)).map(square).filter(is_even).reduce(add), n)
+
+    stream = Stream(range(10)).map(multiplier(3)).filter(lambda x: x > 10)
+    print(stream.to_list(), stream.explain().splitlines()[0])
+    print(Stream([3.5, -1.0, 2.0]).map(square).reduce(max))
+
+    if np is not None:
+        # narrow integer dtypes are widened, not left to wrap around
+        assert Stream(np.array([200], dtype=np.uint8)).map(square).to_list() == [40000]
+        assert Stream(array("i", [100000])).map(square).to_list() == [10 ** 10]
+        assert Stream(np.full(10, 2 ** 30, dtype=np.int32)).map(multiplier(4)).reduce(add) == 10 * 2 ** 32
+    # a kernel of another kind is called, not inlined
+    assert Stream([[1, 2], [3, 4]]).map(max).to_list() == [2, 4]
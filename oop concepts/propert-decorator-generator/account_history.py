@@ -0,0 +1,244 @@
+"""
+Account with a full, replayable history.
+
+Account in property1.py only keeps the current balance and a _transactions
+count, so nobody can check how it got there or what it was last Tuesday.
+Keeping a list of every transaction would fix that, but then the balance at
+some moment means adding up the whole history: O(history).
+
+AccountHistory is append-only and stores each transaction as two numbers in
+two array columns (8 bytes each, no object per transaction):
+
+    times   -> array('d'), never decreasing
+    amounts -> array('q'), signed, in the smallest unit (cents)
+
+Every `snapshot_every` transactions the balance so far is written down as well.
+The balance at a given time is then
+
+    last snapshot before it + the transactions since that snapshot
+
+which is O(snapshot_every) however long the history is (plus a binary search
+on the times).
+
+    a = AccountHistory(1000)
+    a.balance = 1200          # same API as Account, recorded as +200
+    a.deposit(50)
+    a.balance_at(yesterday)
+    a._transactions           # 2, like Account
+
+EventStore holds many accounts, and EventStore.replay(owners, times, amounts)
+loads millions of events at once: with numpy it sorts them by account and
+builds each account's columns and snapshots with cumsum instead of a
+Python-level loop. to_bytes() / from_bytes() give a compact binary copy.
+"""
+import bisect
+import struct
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_HEADER = struct.Struct("<qqq")
+
+
+class AccountHistory:
+    def __init__(self, balance=0, snapshot_every=1024):
+        self.opening_balance = balance
+        self.snapshot_every = snapshot_every
+        self._times = array("d")
+        self._amounts = array("q")
+        self._snapshots = array("q", [balance])   # balance after k * snapshot_every transactions
+        self._balance = balance
+
+    @property
+    def balance(self):
+        return self._balance
+
+    @balance.setter
+    def balance(self, value):
+        self.record(value - self._balance)
+
+    @property
+    def _transactions(self):
+        return len(self._amounts)
+
+    def __len__(self):
+        return len(self._amounts)
+
+    def deposit(self, amount, when=None):
+        if amount <= 0:
+            raise ValueError("Deposit amount must be positive")
+        self.record(amount, when)
+
+    def withdraw(self, amount, when=None):
+        if amount <= 0:
+            raise ValueError("Withdrawal amount must be positive")
+        self.record(-amount, when)
+
+    def record(self, amount, when=None):
+        if when is None:
+            when = time.time()
+        if self._times and when < self._times[-1]:
+            raise ValueError("history is append-only: {} is before the last transaction".format(when))
+        self._amounts.append(amount)
+        self._times.append(when)
+        self._balance += amount
+        if len(self._amounts) % self.snapshot_every == 0:
+            self._snapshots.append(self._balance)
+
+    def balance_after(self, count):
+        """Balance after the first `count` transactions."""
+        if not 0 <= count <= len(self._amounts):
+            raise IndexError("only {} transactions".format(len(self._amounts)))
+        k = count // self.snapshot_every
+        return self._snapshots[k] + sum(self._amounts[k * self.snapshot_every:count])
+
+    def balance_at(self, when):
+        """Balance including every transaction recorded at or before `when`."""
+        return self.balance_after(bisect.bisect_right(self._times, when))
+
+    def events(self, since=None):
+        """(time, amount) pairs, oldest first, optionally only those after `since`."""
+        start = 0 if since is None else bisect.bisect_right(self._times, since)
+        return zip(self._times[start:], self._amounts[start:])
+
+    def _extend(self, times, amounts):
+        """Appends numpy columns (times sorted, amounts int64) in one go."""
+        if not len(amounts):
+            return
+        if self._times and times[0] < self._times[-1]:
+            raise ValueError("history is append-only")
+        every = self.snapshot_every
+        done = len(self._amounts)
+        running = self._balance + np.cumsum(amounts)
+        # positions in `running` where the total count reaches a multiple of snapshot_every
+        first = (-done) % every or every
+        self._snapshots.frombytes(running[first - 1::every].tobytes())
+        self._times.frombytes(np.ascontiguousarray(times, dtype=np.float64).tobytes())
+        self._amounts.frombytes(np.ascontiguousarray(amounts, dtype=np.int64).tobytes())
+        self._balance = int(running[-1])
+
+    def to_bytes(self):
+        header = _HEADER.pack(len(self._amounts), self.snapshot_every, self.opening_balance)
+        return header + self._times.tobytes() + self._amounts.tobytes() + self._snapshots.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        count, every, opening = _HEADER.unpack_from(data)
+        account = cls(opening, every)
+        offset = _HEADER.size
+        account._times.frombytes(data[offset:offset + 8 * count])
+        offset += 8 * count
+        account._amounts.frombytes(data[offset:offset + 8 * count])
+        offset += 8 * count
+        account._snapshots = array("q")
+        account._snapshots.frombytes(data[offset:])
+        account._balance = account.balance_after(count)
+        return account
+
+
+class EventStore:
+    def __init__(self, snapshot_every=1024):
+        self.snapshot_every = snapshot_every
+        self.accounts = {}
+
+    def open(self, owner, balance=0):
+        if owner in self.accounts:
+            raise ValueError("account {!r} already exists".format(owner))
+        account = self.accounts[owner] = AccountHistory(balance, self.snapshot_every)
+        return account
+
+    def __getitem__(self, owner):
+        return self.accounts[owner]
+
+    def record(self, owner, amount, when=None):
+        account = self.accounts.get(owner)
+        if account is None:
+            account = self.open(owner)
+        account.record(amount, when)
+
+    def balance_at(self, owner, when):
+        return self.accounts[owner].balance_at(when)
+
+    def replay(self, owners, times, amounts):
+        """Loads three equal-length columns of events, sorted by time within each account."""
+        if np is None:
+            for owner, when, amount in zip(owners, times, amounts):
+                self.record(owner, amount, when)
+            return
+        keys, inverse = np.unique(np.asarray(owners), return_inverse=True)
+        times = np.asarray(times, dtype=np.float64)
+        amounts = np.asarray(amounts, dtype=np.int64)
+        if not len(inverse):
+            return
+        order = np.argsort(inverse, kind="stable")
+        inverse, times, amounts = inverse[order], times[order], amounts[order]
+        bounds = np.flatnonzero(np.diff(inverse)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(inverse)]))
+        # check every account's times are in order before changing anything
+        same_account = inverse[1:] == inverse[:-1]
+        if np.any(same_account & (times[1:] < times[:-1])):
+            raise ValueError("events must be in time order within each account")
+        groups = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            owner = keys[inverse[start]].item()
+            account = self.accounts.get(owner)
+            if account is not None and account._times and times[start] < account._times[-1]:
+                raise ValueError("history of {!r} is append-only: event at {} is before its last one".format(
+                    owner, times[start]))
+            groups.append((owner, account, start, end))
+        for owner, account, start, end in groups:
+            if account is None:
+                account = self.open(owner)
+            account._extend(times[start:end], amounts[start:end])
+
+
+if __name__ == "__main__":
+    import random
+
+    a = AccountHistory(1000, snapshot_every=4)
+    a.balance = 1200                  # like Account: a.balance = 1200
+    today = time.time()
+    for day in range(1, 11):
+        a.record(day * 10, when=today + day * 86400)
+    print("balance", a.balance, "after", a._transactions, "transactions")
+    print("balance 5 days from now:", a.balance_at(today + 5 * 86400))
+    copy = AccountHistory.from_bytes(a.to_bytes())
+    assert copy.balance == a.balance and copy.balance_at(today) == a.balance_at(today)
+
+    accounts, n = 10000, 5000000
+    rng = np.random.default_rng(3) if np is not None else None
+    if rng is not None:
+        owners = rng.integers(0, accounts, n)
+        times = np.sort(rng.uniform(0, 86400 * 365, n))
+        amounts = rng.integers(-5000, 5000, n)
+    else:
+        n = 500000
+        r = random.Random(3)
+        owners = [r.randrange(accounts) for _ in range(n)]
+        times = sorted(r.uniform(0, 86400 * 365) for _ in range(n))
+        amounts = [r.randrange(-5000, 5000) for _ in range(n)]
+
+    store = EventStore(snapshot_every=256)
+    start = time.perf_counter()
+    store.replay(owners, times, amounts)
+    elapsed = time.perf_counter() - start
+    print("replayed {:,} events into {:,} accounts in {:.2f}s ({:,.0f} events/s)".format(
+        n, len(store.accounts), elapsed, n / elapsed))
+
+    busiest = max(store.accounts.values(), key=len)
+    when = busiest._times[len(busiest) // 2]
+    start = time.perf_counter()
+    for _ in range(10000):
+        value = busiest.balance_at(when)
+    per_call = (time.perf_counter() - start) / 10000
+    expected = busiest.opening_balance + sum(amount for t, amount in busiest.events() if t <= when)
+    assert value == expected
+    print("balance_at with {} transactions: {:.1f} us (snapshot every {})".format(
+        len(busiest), per_call * 1e6, busiest.snapshot_every))
+    size = sum(len(account.to_bytes()) for account in store.accounts.values())
+    print("encoded size {:.1f} MB ({:.1f} bytes per event)".format(size / 1e6, size / n))
@@ -0,0 +1,334 @@
+"""
+The decorators2.py decorators, safe to put on `async def` functions.
+
+rate_limit, log_requests, retry, timer and log_errors in decorators2.py all
+assume a normal function. On a coroutine function they go wrong in two ways:
+    - they wrap the *creation* of the coroutine, so timer measures ~1us and
+      log_errors never sees the exception (it is raised later, on await)
+    - or they block the event loop: retry's time.sleep(1) and log_requests'
+      open() / write() stop every other task while they run
+
+Each decorator here checks inspect.iscoroutinefunction(func) once and gives
+coroutine functions their own wrapper:
+
+    rate_limit   -> same sliding window; the check and the append have no await
+                    between them, so on one loop they can't interleave
+    log_requests -> calls go on a queue, a writer thread formats and appends them
+                    in batches (used for normal functions too, nobody waits on
+                    the disk). Arguments are repr'd by the writer, so log
+                    immutable values if you mutate them right after the call
+    retry        -> resilient() from resilience.py: backoff with full jitter,
+                    awaits asyncio.sleep on coroutine functions
+    timer        -> timed() from timing.py, times the awaited work
+    log_errors   -> log_errors() from error_log.py, flushes on a worker thread
+
+Run this file to check the event loop with 10,000 concurrent tasks: the
+slowest single task step (what a blocking call inside a task shows up as) and
+the worst overall lag.
+"""
+import asyncio
+import atexit
+import collections
+import datetime
+import functools
+import inspect
+import queue
+import sys
+import threading
+import time
+import traceback
+
+from error_log import log_errors
+from resilience import resilient
+from timing import timed as timer
+
+__all__ = ["rate_limit", "log_requests", "retry", "timer", "log_errors", "flush_requests"]
+
+
+def rate_limit(max_calls, time_period):
+    def decorator(func):
+        calls = collections.deque()
+        lock = threading.Lock()
+
+        def allowed():
+            now = time.monotonic()
+            # Remove outdated calls
+            while calls and calls[0] < now - time_period:
+                calls.popleft()
+            if len(calls) < max_calls:
+                calls.append(now)
+                return True
+            return False
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if allowed():
+                    return await func(*args, **kwargs)
+                print("Too many requests! Try again later.")
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with lock:
+                ok = allowed()
+            if ok:
+                return func(*args, **kwargs)
+            print("Too many requests! Try again later.")
+        return wrapper
+    return decorator
+
+
+class _LineWriter(threading.Thread):
+    """Appends queued lines to their files, in batches, off the caller's thread."""
+
+    def __init__(self):
+        super().__init__(name="log_requests writer", daemon=True)
+        self.queue = queue.SimpleQueue()
+        # lines put but not yet written; counted on put() so a batch the thread
+        # has taken off the queue but not written yet still counts
+        self.outstanding = 0
+        self.done = threading.Condition()
+
+    def put(self, item):
+        with self.done:
+            self.outstanding += 1
+        self.queue.put(item)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception:
+                # report it and keep going: if this thread died, every later
+                # line would be queued forever and never written
+                _report("log_requests: dropped {} line(s)".format(len(batch)))
+            with self.done:
+                self.outstanding -= len(batch)
+                if not self.outstanding:
+                    self.done.notify_all()
+
+    @staticmethod
+    def write(batch):
+        by_file = collections.defaultdict(list)
+        for filename, stamp, name, args, kwargs in batch:
+            by_file[filename].append("{} - Called {} with {}, {}\n".format(
+                datetime.datetime.fromtimestamp(stamp), name, args, kwargs))
+        for filename, lines in by_file.items():
+            try:
+                with open(filename, "a") as f:
+                    f.writelines(lines)
+            except OSError:
+                # one unwritable file doesn't lose the other files' lines
+                _report("log_requests: could not write {} line(s) to {}".format(len(lines), filename))
+
+
+def _report(message):
+    print(message, file=sys.stderr)
+    traceback.print_exc()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _LineWriter()
+            _writer.start()
+        return _writer
+
+
+@atexit.register
+def flush_requests(timeout=5.0):
+    """Waits until every queued request line is on disk."""
+    if _writer is not None:
+        with _writer.done:
+            _writer.done.wait_for(lambda: not _writer.outstanding, timeout)
+
+
+def log_requests(func=None, *, filename="requests.log"):
+    if func is None:
+        return lambda f: log_requests(f, filename=filename)
+    writer = _get_writer()
+
+    def log_line(args, kwargs):
+        # formatting happens on the writer thread too, the caller only enqueues
+        writer.put((filename, time.time(), func.__name__, args, kwargs))
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            log_line(args, kwargs)
+            return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        log_line(args, kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def retry(max_retries=3, delay=1.0, retry_on=(Exception,)):
+    """decorators2.retry() with real exceptions and backoff that doesn't block the loop."""
+    return resilient(max_retries=max_retries, base_delay=delay, retry_on=retry_on)
+
+
+if __name__ == "__main__":
+    import contextlib
+    import gc
+    import logging
+    import os
+    import random
+    import tempfile
+
+    from error_log import flush_all
+
+    # decorators2.py's retry / log_requests, ported to async the naive way:
+    # they await the function but still sleep and write synchronously
+    def blocking_retry(max_retries=3, delay=0.01):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except ConnectionError:
+                        time.sleep(delay)
+                return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def blocking_log_requests(filename):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with open(filename, "a") as f:
+                    f.write(f"{datetime.datetime.now()} - Called {func.__name__} with {args}, {kwargs}\n")
+                return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    async def watch_loop_lag(stop, interval=0.001):
+        """Largest delay between asking to wake up and actually waking up."""
+        worst = 0.0
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            worst = max(worst, time.perf_counter() - start - interval)
+        return worst
+
+    async def run(fetch, tasks):
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(watch_loop_lag(stop))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(fetch(i) for i in range(tasks)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        return elapsed, await watcher, results
+
+    class SlowSteps(logging.Handler):
+        """Collects asyncio debug mode's "Executing <Task ...> took 0.012 seconds" warnings."""
+
+        def __init__(self):
+            super().__init__()
+            self.durations = []
+
+        def emit(self, record):
+            # main() below starts all the tasks in one step; only the tasks count
+            if record.msg.startswith("Executing") and "main()" not in str(record.args[0]):
+                self.durations.append(record.args[-1])
+
+    def slow_steps(fetch, tasks, threshold=0.005):
+        """Task steps (one resume of one task) that held the loop for more than `threshold` s.
+
+        The lag watcher above also counts the time spent running 10,000 quick
+        steps back to back, which grows with any per-task overhead; this counts
+        only steps that were slow on their own, i.e. blocked. The cyclic GC is
+        paused, or its full collections would land in random steps.
+        """
+        async def main():
+            asyncio.get_running_loop().slow_callback_duration = threshold
+            return await asyncio.gather(*(fetch(i) for i in range(tasks)))
+
+        handler, logger = SlowSteps(), logging.getLogger("asyncio")
+        logger.addHandler(handler)
+        logger.propagate = False
+        gc.collect()
+        gc.disable()
+        try:
+            asyncio.run(main(), debug=True)
+        finally:
+            gc.enable()
+            logger.removeHandler(handler)
+            logger.propagate = True
+        return handler.durations
+
+    rng = random.Random(1)
+
+    async def fetch_data(i):
+        await asyncio.sleep(0.01)
+        if rng.random() < 0.02:
+            raise ConnectionError("flaky")
+        if i % 1000 == 999:
+            raise ValueError("bad item {}".format(i))
+        return i
+
+    async def fetch_data_safe(i):
+        try:
+            return await fetch_data(i)
+        except (ConnectionError, ValueError):
+            return None
+
+    tasks = 10000
+    with tempfile.TemporaryDirectory() as tmp, \
+            open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        requests_log = os.path.join(tmp, "requests.log")
+
+        rows = []
+        bare_elapsed, bare_lag, _ = asyncio.run(run(fetch_data_safe, tasks))
+        rows.append(("undecorated", bare_elapsed, bare_lag, slow_steps(fetch_data_safe, tasks)))
+
+        blocking = log_errors(os.path.join(tmp, "old_errors.log"))(
+            timer(blocking_retry(3)(blocking_log_requests(requests_log)(fetch_data))))
+        old_elapsed, old_lag, _ = asyncio.run(run(blocking, tasks))
+        rows.append(("blocking sleep + write", old_elapsed, old_lag, slow_steps(blocking, tasks)))
+
+        os.remove(requests_log)
+        native = log_errors(os.path.join(tmp, "errors.log"), flush_interval=0.1)(
+            timer(retry(3, delay=0.01, retry_on=(ConnectionError,))(
+                rate_limit(100000, 1)(log_requests(fetch_data, filename=requests_log)))))
+        elapsed, lag, results = asyncio.run(run(native, tasks))
+        flush_requests()
+        flush_all()
+        with open(requests_log) as f:
+            logged = sum(1 for _ in f)
+        rows.append(("native async path", elapsed, lag, slow_steps(native, tasks)))
+        flush_requests()
+        flush_all()
+
+    # The worst lag includes running every ready task once: gather() resumes
+    # all 10,000 in the same loop iteration, so it grows with the per-task cost
+    # of the wrappers (five coroutine frames instead of one) even when nothing
+    # blocks. Steps over 5 ms are the ones that blocked the loop on their own.
+    # An odd step just over 5 ms on the native path is the writer threads
+    # holding the GIL for one switch interval (sys.getswitchinterval(), 5 ms),
+    # not a wait on the disk.
+    print("{} concurrent tasks".format(tasks))
+    print("{:<24} {:>7} {:>17} {:>16} {:>14}".format(
+        "", "time", "worst loop lag", "steps > 5 ms", "slowest step"))
+    for label, seconds, worst, slow in rows:
+        print("{:<24} {:>6.2f}s {:>15.1f}ms {:>16,} {:>12.1f}ms".format(
+            label, seconds, worst * 1000, len(slow), max(slow, default=0) * 1000))
+    print("{} request lines written, {} results, {} errors logged".format(
+        logged, sum(r is not None for r in results), sum(r is None for r in results)))
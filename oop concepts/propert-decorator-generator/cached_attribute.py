@@ -0,0 +1,278 @@
+"""
+A cached property that knows what it depends on.
+
+Data.processed and User.hashed_password (property1.py) and Report.summary
+(property2.py) all hand-roll the same cache:
+
+    if self._summary is None:
+        self._summary = sum(self.data) / len(self.data)
+    return self._summary
+
+and Report.summary goes stale without telling anyone as soon as you do
+`report.data = new_list`, because nothing resets _summary.
+
+cached_property(*depends_on) declares the attributes the value is computed
+from. When the class is created it puts a small descriptor on each of those
+attributes, and assigning or deleting any of them drops the cached value:
+
+    class Report:
+        def __init__(self, data):
+            self.data = data
+
+        @cached_property("data")
+        def summary(self):
+            return sum(self.data) / len(self.data)
+
+    r = Report([10, 20, 30, 40])
+    r.summary          # computed, 25.0
+    r.summary          # cached
+    r.data = [1, 2]    # cache dropped
+    r.summary          # computed again, 1.5
+
+- Without __slots__ the value is stored in the instance __dict__ under the
+  property's own name, so a cached read is a plain attribute lookup.
+- With __slots__, add a slot called "_<name>_cache" and the value lives there,
+  plus "__weakref__" or "_cache_lock" (see below).
+- The first computation is done under a lock belonging to the instance, so two
+  threads never compute the same value twice, while other instances compute
+  at the same time. Assigning a dependency takes the same lock, so a value
+  computed from old data is never stored after the data changed. Every
+  cached_property of an instance shares that one lock, so chained properties
+  can't take two locks in opposite orders and deadlock. The lock is kept in a
+  table keyed by id(instance) and dropped when the instance dies (weakref), or
+  in a "_cache_lock" slot for classes that can't be weakly referenced.
+- A cached_property can depend on another cached_property, and on a property
+  or attribute inherited from a base class (its setter still runs).
+- In-place changes (r.data.append(50)) are not assignments and are not seen;
+  call Report.summary.invalidate(r) for those.
+"""
+import threading
+import weakref
+
+_MISSING = object()
+_locks = {}                         # id(instance) -> RLock, until the instance dies
+_locks_lock = threading.Lock()      # only held to create a lock, never while computing
+
+
+def _lock_for(instance):
+    lock = _locks.get(id(instance))
+    if lock is not None:
+        return lock
+    with _locks_lock:
+        if type(instance).__weakrefoffset__:
+            lock = _locks.get(id(instance))
+            if lock is None:
+                lock = _locks[id(instance)] = threading.RLock()
+                weakref.finalize(instance, _locks.pop, id(instance), None)
+            return lock
+        try:
+            return instance._cache_lock
+        except AttributeError:
+            lock = instance._cache_lock = threading.RLock()
+            return lock
+
+
+def _lookup(owner, name):
+    """What owner.name finds on the class, searching the bases too, or None."""
+    for klass in owner.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+    return None
+
+
+def _invalidate_all(dependents, instance):
+    for dependent in dependents:
+        # a subclass's property is listed on the base class's attribute too
+        if isinstance(instance, dependent.owner):
+            dependent.invalidate(instance)
+
+
+class _Dependency:
+    """Sits on a dependency attribute and invalidates cached values on writes."""
+
+    def __init__(self, name, inner):
+        self.name = name
+        self.inner = inner      # property / slot descriptor we replaced, or None
+        self.dependents = []
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if self.inner is not None:
+            return self.inner.__get__(instance, owner)
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError("{!r} object has no attribute {!r}".format(
+                type(instance).__name__, self.name)) from None
+
+    def __set__(self, instance, value):
+        self._write(instance, value)
+
+    def __delete__(self, instance):
+        self._write(instance, _MISSING)
+
+    def _write(self, instance, value):
+        with _lock_for(instance):
+            if value is _MISSING:
+                if self.inner is not None:
+                    self.inner.__delete__(instance)
+                else:
+                    try:
+                        del instance.__dict__[self.name]
+                    except KeyError:
+                        raise AttributeError(self.name) from None
+            elif self.inner is not None:
+                self.inner.__set__(instance, value)
+            else:
+                instance.__dict__[self.name] = value
+            _invalidate_all(self.dependents, instance)
+
+
+class cached_property:
+    def __init__(self, *depends_on):
+        if len(depends_on) == 1 and callable(depends_on[0]):
+            # used as @cached_property without arguments
+            self._init(depends_on[0], ())
+        else:
+            self.depends_on = depends_on
+            self.func = None
+
+    def __call__(self, func):
+        self._init(func, self.depends_on)
+        return self
+
+    def _init(self, func, depends_on):
+        self.func = func
+        self.depends_on = depends_on
+        self.__doc__ = func.__doc__
+        self.dependents = []
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+        slot = owner.__dict__.get("_{}_cache".format(name))
+        # a slot member descriptor has __get__, __set__ and __delete__
+        self.slot = slot if slot is not None and hasattr(slot, "__delete__") else None
+        if self.slot is None and "__slots__" in owner.__dict__ and "__dict__" not in owner.__slots__:
+            raise TypeError("{}.{}: add '_{}_cache' to __slots__ to hold the cached value".format(
+                owner.__name__, name, name))
+        if not owner.__weakrefoffset__ and _lookup(owner, "_cache_lock") is None:
+            raise TypeError("{}.{}: add '__weakref__' or '_cache_lock' to __slots__ for the lock".format(
+                owner.__name__, name))
+
+        for dep in self.depends_on:
+            current = _lookup(owner, dep)
+            if isinstance(current, cached_property):
+                current.dependents.append(self)
+            elif isinstance(current, _Dependency) and owner.__dict__.get(dep) is current:
+                current.dependents.append(self)
+            else:
+                # an inherited property or _Dependency is wrapped, not replaced,
+                # so its setter and the base class's own invalidation still run
+                if current is not None and not hasattr(current, "__set__"):
+                    raise TypeError("{}.{} depends on {!r}, which is a plain class attribute".format(
+                        owner.__name__, name, dep))
+                wrapper = _Dependency(dep, current)
+                wrapper.dependents.append(self)
+                setattr(owner, dep, wrapper)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if self.slot is not None:
+            try:
+                return self.slot.__get__(instance, owner)
+            except AttributeError:
+                pass
+        # without slots we only get here when the __dict__ has no value yet
+        with _lock_for(instance):
+            value = self._cached(instance)
+            if value is _MISSING:
+                value = self.func(instance)
+                if self.slot is not None:
+                    self.slot.__set__(instance, value)
+                else:
+                    instance.__dict__[self.name] = value
+            return value
+
+    def _cached(self, instance):
+        if self.slot is not None:
+            try:
+                return self.slot.__get__(instance, type(instance))
+            except AttributeError:
+                return _MISSING
+        return instance.__dict__.get(self.name, _MISSING)
+
+    def invalidate(self, instance):
+        """Drops the cached value (and the values that depend on it)."""
+        with _lock_for(instance):
+            if self.slot is not None:
+                try:
+                    self.slot.__delete__(instance)
+                except AttributeError:
+                    pass
+            else:
+                instance.__dict__.pop(self.name, None)
+            _invalidate_all(self.dependents, instance)
+
+
+if __name__ == "__main__":
+    import time
+
+    class Report:
+        def __init__(self, data):
+            self.data = data
+
+        @cached_property("data")
+        def summary(self):
+            """Computes a summary only when needed and caches it."""
+            print("Computing summary...")
+            return sum(self.data) / len(self.data)
+
+        @cached_property("summary")
+        def label(self):
+            return "average {:.1f}".format(self.summary)
+
+    r = Report([10, 20, 30, 40])
+    print(r.summary)   # Computing summary... 25.0
+    print(r.summary)   # cached
+    print(r.label)
+    r.data = [1, 2]    # drops summary and label
+    print(r.label)     # Computing summary... average 1.5
+
+    class User:
+        __slots__ = ("name", "_hashed_password_cache", "_cache_lock")
+
+        def __init__(self, name):
+            self.name = name
+
+        @cached_property("name")
+        def hashed_password(self):
+            print("Hashing password...")
+            return hash(self.name)
+
+    u = User("admin")
+    u.hashed_password
+    u.hashed_password
+    u.name = "root"    # Hashing password... again on the next read
+    u.hashed_password
+
+    class Data:
+        def __init__(self, value):
+            self.value = value
+
+        @cached_property("value")
+        def processed(self):
+            time.sleep(0.05)   # expensive, and 8 threads ask at once
+            computed.append(1)
+            return self.value ** 2
+
+    computed = []
+    d = Data(10)
+    threads = [threading.Thread(target=lambda: d.processed) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print("8 threads, computed {} time(s), value {}".format(len(computed), d.processed))
@@ -0,0 +1,219 @@
+"""
+Config singleton that reads a file and reloads it when the file changes.
+
+Config in property1.py:
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._api_key = "SECRET"
+        return cls._instance
+
+has three problems: two threads can both see _instance is None and build two
+objects, the api key is hard-coded, and nothing can ever change it.
+
+Here:
+    - Config(path) uses double-checked locking, so exactly one instance is made
+    - the file (JSON) is read lazily, on the first read of a value, exactly once
+    - all values live in one immutable snapshot (a MappingProxyType). A reload
+      builds a complete new snapshot and swaps it in with one assignment, so a
+      reader sees either the whole old config or the whole new one, and reading
+      never takes a lock
+    - watch(interval) starts a daemon thread that os.stat()s the file every
+      `interval` seconds and reloads when the mtime or size changed. (The
+      standard library has no inotify; polling one stat() a second is cheap.)
+    - a file that doesn't parse is reported and the old snapshot is kept
+
+    config = Config("settings.json")
+    config.api_key                 # property, like before
+    config["timeout"]
+    settings = config.snapshot()   # several values guaranteed to belong together
+    config.watch(1.0)
+"""
+import json
+import os
+import threading
+import types
+
+
+class Config:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, path=None):
+        instance = cls._instance
+        if instance is None:
+            with cls._instance_lock:
+                instance = cls._instance
+                if instance is None:
+                    instance = super().__new__(cls)
+                    instance._setup(path or os.environ.get("CONFIG_FILE", "config.json"))
+                    cls._instance = instance
+        if path is not None and os.path.abspath(path) != instance.path:
+            raise ValueError("Config already loaded from {}".format(instance.path))
+        return instance
+
+    def _setup(self, path):
+        self.path = os.path.abspath(path)
+        self._snapshot = None
+        self._stamp = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reloads = 0
+        self.last_error = None
+
+    # -- reading, no locks ------------------------------------------------
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._first_load()
+        return snapshot
+
+    @property
+    def api_key(self):
+        return self.snapshot()["api_key"]
+
+    def __getitem__(self, key):
+        return self.snapshot()[key]
+
+    def get(self, key, default=None):
+        return self.snapshot().get(key, default)
+
+    # -- loading --------------------------------------------------------------
+
+    def _first_load(self):
+        with self._reload_lock:
+            if self._snapshot is None:
+                stamp = self._stat()
+                self._snapshot = self._read()
+                self._stamp = stamp
+            return self._snapshot
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self):
+        with open(self.path) as f:
+            values = json.load(f)
+        if not isinstance(values, dict):
+            raise ValueError("{} must contain a JSON object".format(self.path))
+        return types.MappingProxyType(values)
+
+    def reload_if_changed(self):
+        """Reloads if the file's mtime or size changed. True if a new snapshot was swapped in."""
+        try:
+            stamp = self._stat()
+        except OSError as e:
+            self.last_error = e
+            return False
+        if stamp == self._stamp:
+            return False
+        with self._reload_lock:
+            if stamp == self._stamp:
+                return False
+            try:
+                snapshot = self._read()
+            except (OSError, ValueError) as e:
+                # half-written or broken file: keep serving the old values
+                self.last_error = e
+                return False
+            self._stamp = stamp
+            self._snapshot = snapshot
+            self.reloads += 1
+            self.last_error = None
+            return True
+
+    def watch(self, interval=1.0):
+        """Starts a daemon thread that calls reload_if_changed() every `interval` seconds."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=run, name="config watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+    @classmethod
+    def _reset(cls):
+        """Forgets the instance (for demos and tests)."""
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.stop_watching()
+            cls._instance = None
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "settings.json")
+
+        def write(api_key, version):
+            # write-then-rename so the watcher never sees half a file
+            with open(path + ".tmp", "w") as f:
+                json.dump({"api_key": api_key, "version": version, "timeout": 30}, f)
+            os.replace(path + ".tmp", path)
+
+        write("SECRET-0", 0)
+        instances = []
+        threads = [threading.Thread(target=lambda: instances.append(Config(path))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        config = Config()
+        print("8 threads, {} distinct instance(s), api_key {}".format(
+            len({id(i) for i in instances}), config.api_key))
+
+        config.watch(0.01)
+        stop = threading.Event()
+        reads = [0] * 4
+        mismatched = []
+
+        def reader(i):
+            while not stop.is_set():
+                settings = config.snapshot()
+                if settings["api_key"] != "SECRET-{}".format(settings["version"]):
+                    mismatched.append(settings)
+                reads[i] += 1
+
+        readers = [threading.Thread(target=reader, args=(i,)) for i in range(4)]
+        for t in readers:
+            t.start()
+        for version in range(1, 6):
+            time.sleep(0.1)
+            write("SECRET-{}".format(version), version)
+        time.sleep(0.1)
+        stop.set()
+        for t in readers:
+            t.join()
+        print("{:,} reads while the file changed 5 times: {} reload(s), {} torn reads, api_key {}".format(
+            sum(reads), config.reloads, len(mismatched), config.api_key))
+
+        lock = threading.Lock()
+        n = 1000000
+        start = time.perf_counter()
+        for _ in range(n):
+            config.api_key
+        lock_free = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(n):
+            with lock:
+                config.api_key
+        locked = time.perf_counter() - start
+        print("config.api_key: {:.0f} ns lock-free, {:.0f} ns behind a lock".format(
+            lock_free / n * 1e9, locked / n * 1e9))
+        Config._reset()
@@ -0,0 +1,196 @@
+"""
+Contention free call counters with calls/sec.
+
+count_calls (decorator1.py), CountCalls (higher order function.py) and
+CallCounter (args kwargs.py, what I understood/3-args kwargs.py) all do
+`count += 1` and print on every call. `+=` on a shared int is a read and a
+write, so two threads can lose increments, and the print is the slowest part
+of the whole call.
+
+@counted gives every thread its own cell, so the call path never takes a
+lock and never prints. A cell also keeps a ring of per-second buckets for the
+last WINDOW seconds, which is what rate() reads. Cells are only added up when
+somebody asks:
+
+    @counted
+    def greet(name): ...
+
+    greet.counter.count          # total calls, like CallCounter.count
+    greet.counter.rate(10)       # calls/sec over the last 10 seconds
+    print(report())              # every counted function
+"""
+import functools
+import threading
+import time
+
+WINDOW = 60  # seconds of history kept for rate()
+
+
+class _Cell:
+    """One thread's counts for one function."""
+
+    __slots__ = ("total", "seconds", "counts")
+
+    def __init__(self):
+        self.total = 0
+        self.seconds = [-1] * WINDOW
+        self.counts = [0] * WINDOW
+
+
+class Counter:
+    def __init__(self, name, clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self.local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()
+
+    def new_cell(self):
+        cell = self.local.cell = _Cell()
+        with self._lock:
+            self._cells.append(cell)
+        return cell
+
+    def hit(self):
+        try:
+            cell = self.local.cell
+        except AttributeError:
+            cell = self.new_cell()
+        cell.total += 1
+        second = int(self.clock())
+        slot = second % WINDOW
+        if cell.seconds[slot] != second:
+            cell.seconds[slot] = second
+            cell.counts[slot] = 0
+        cell.counts[slot] += 1
+
+    def cells(self):
+        with self._lock:
+            return list(self._cells)
+
+    @property
+    def count(self):
+        return sum(cell.total for cell in self.cells())
+
+    def rate(self, window=10):
+        """Calls per second over the last `window` seconds (max WINDOW)."""
+        window = min(window, WINDOW)
+        now = int(self.clock())
+        calls = 0
+        for cell in self.cells():
+            for second, count in zip(cell.seconds, cell.counts):
+                if now - window < second <= now:
+                    calls += count
+        return calls / window
+
+    def reset(self):
+        for cell in self.cells():
+            cell.__init__()
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_counter(name):
+    counter = _registry.get(name)
+    if counter is None:
+        with _registry_lock:
+            counter = _registry.setdefault(name, Counter(name))
+    return counter
+
+
+def counted(func=None, *, name=None):
+    """Decorator: count calls per thread, no lock and no print on the call path."""
+    if func is None:
+        return lambda f: counted(f, name=name)
+
+    counter = get_counter(name or "{}.{}".format(func.__module__, func.__qualname__))
+    local = counter.local
+    clock = counter.clock
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Counter.hit() inlined, this runs on every call
+        try:
+            cell = local.cell
+        except AttributeError:
+            cell = counter.new_cell()
+        cell.total += 1
+        second = int(clock())
+        slot = second % WINDOW
+        if cell.seconds[slot] != second:
+            cell.seconds[slot] = second
+            cell.counts[slot] = 0
+        cell.counts[slot] += 1
+        return func(*args, **kwargs)
+
+    wrapper.counter = counter
+    return wrapper
+
+
+def counters():
+    with _registry_lock:
+        return dict(_registry)
+
+
+def snapshot(windows=(1, 10, 60)):
+    """Returns {name: {"count": n, "rate_1s": ..., "rate_10s": ...}}."""
+    result = {}
+    for name, counter in counters().items():
+        row = {"count": counter.count}
+        for window in windows:
+            row["rate_{}s".format(window)] = counter.rate(window)
+        result[name] = row
+    return result
+
+
+def report():
+    lines = ["{:<40} {:>10} {:>12} {:>12}".format("function", "calls", "calls/s 10s", "calls/s 60s")]
+    for name, row in sorted(snapshot((10, 60)).items()):
+        lines.append("{:<40} {:>10} {:>12.1f} {:>12.1f}".format(
+            name[-40:], row["count"], row["rate_10s"], row["rate_60s"]))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import contextlib
+    import os
+
+    class CountCalls:
+        # the old class based decorator from higher order function.py
+        def __init__(self, func):
+            self.func = func
+            self.count = 0
+
+        def __call__(self, *args, **kwargs):
+            self.count += 1
+            print(f"Function {self.func.__name__} has been called {self.count} times")
+            return self.func(*args, **kwargs)
+
+    def greet(name):
+        return name
+
+    threads, calls = 8, 50000
+
+    def hammer(f):
+        workers = [threading.Thread(target=lambda: [f("x") for _ in range(calls)])
+                   for _ in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return time.perf_counter() - start
+
+    old = CountCalls(greet)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        old_time = hammer(old)
+    new = counted(greet, name="greet")
+    new_time = hammer(new)
+
+    expected = threads * calls
+    print("CountCalls: {} of {} calls counted in {:.2f}s".format(old.count, expected, old_time))
+    print("@counted:   {} of {} calls counted in {:.2f}s".format(new.counter.count, expected, new_time))
+    print()
+    print(report())
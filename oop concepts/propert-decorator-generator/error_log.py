@@ -0,0 +1,269 @@
+"""
+Deduplicating, batched error logging.
+
+log_errors() in decorators2.py opens errors.log and writes the whole
+traceback.format_exc() for every exception. If the same call fails in a hot
+loop that is one open() + one formatted traceback + one write per failure:
+the log grows by megabytes per second and the failing path gets even slower.
+
+log_errors() here fingerprints each exception by
+    (exception type, file, line, function) of the frame that raised it
+which only needs a walk down the traceback, no formatting. The full
+traceback is formatted and written only the first time a fingerprint is seen.
+After that we only bump a counter and a last-seen time. Writes are buffered
+and flushed in one batch at most every `flush_interval` seconds (and at exit),
+with one summary line per fingerprint that repeated. A daemon thread flushes
+whatever is still waiting once per interval, so an error with nothing after it
+reaches the file within `flush_interval` too, not only at exit:
+
+    REPEAT ZeroDivisionError @ demo.py:12 in risky_function x 48211 (total 48212, last 2026-10-19 10:01:02)
+
+    @log_errors()
+    def risky_function():
+        return 1 / 0
+
+On `async def` functions the batched write is handed to a worker thread so the
+event loop never waits on the file.
+"""
+import asyncio
+import atexit
+import datetime
+import functools
+import inspect
+import threading
+import time
+import traceback
+
+
+def fingerprint(exc):
+    """(type name, file, line, function) of the frame that raised `exc`."""
+    tb = exc.__traceback__
+    if tb is None:
+        return (type(exc).__qualname__, "?", 0, "?")
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    code = tb.tb_frame.f_code
+    return (type(exc).__qualname__, code.co_filename, tb.tb_lineno, code.co_name)
+
+
+class _Seen:
+    __slots__ = ("count", "flushed", "first_seen", "last_seen")
+
+    def __init__(self, now):
+        self.count = 0
+        self.flushed = 1
+        self.first_seen = now
+        self.last_seen = now
+
+
+class ErrorLog:
+    """Collects errors in memory and writes them to `filename` in batches."""
+
+    def __init__(self, filename, flush_interval=5.0, clock=time.time):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.seen = {}
+        self._pending = []
+        self._last_flush = clock()
+        self._dirty = False
+        self._flusher = None
+        self._stop = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()     # keeps batches in order, only flushers wait on it
+
+    def record(self, exc, where, flush=True):
+        """Returns True if this is the first time this fingerprint was seen.
+
+        With flush=False the caller is responsible for claim_flush() / flush().
+        """
+        key = fingerprint(exc)
+        now = self.clock()
+        with self._lock:
+            entry = self.seen.get(key)
+            first = entry is None
+            if first:
+                entry = self.seen[key] = _Seen(now)
+                self._pending.append("{} FIRST {} in {}: {}\n{}\n".format(
+                    _stamp(now), _describe(key), where, exc,
+                    "".join(traceback.format_exception(exc))))
+            entry.count += 1
+            entry.last_seen = now
+            self._dirty = True
+            if self._flusher is None:
+                self._start_flusher()
+        if flush and self.claim_flush():
+            self.flush()
+        return first
+
+    def claim_flush(self):
+        """True (once) when a flush is due; the caller must then call flush()."""
+        now = self.clock()
+        with self._lock:
+            if now - self._last_flush < self.flush_interval:
+                return False
+            self._last_flush = now
+            return True
+
+    def flush(self):
+        with self._write_lock:
+            # take the lines under the lock, write them outside it, so threads
+            # recording errors never wait on the disk
+            with self._lock:
+                lines = self._pending
+                self._pending = []
+                for key, entry in self.seen.items():
+                    repeats = entry.count - entry.flushed
+                    if repeats:
+                        lines.append("{} REPEAT {} x {} (total {}, last {})\n".format(
+                            _stamp(self.clock()), _describe(key), repeats, entry.count,
+                            _stamp(entry.last_seen)))
+                        entry.flushed = entry.count
+                self._last_flush = self.clock()
+                self._dirty = False
+            if lines:
+                with open(self.filename, "a") as f:
+                    f.writelines(lines)
+
+    def _start_flusher(self):
+        # called with self._lock held, on the first record() after __init__ or close()
+        self._stop = stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, args=(stop,),
+                                         name="error-log-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self, stop):
+        while not stop.wait(self.flush_interval):
+            if self._dirty:
+                self.flush()
+
+    def close(self):
+        """Stops the flusher thread and writes everything still waiting."""
+        with self._lock:
+            flusher, stop = self._flusher, self._stop
+            self._flusher = self._stop = None
+        if flusher is not None:
+            stop.set()
+            flusher.join()
+        self.flush()
+
+    def stats(self):
+        """Returns {fingerprint: (count, first_seen, last_seen)}."""
+        with self._lock:
+            return {key: (e.count, e.first_seen, e.last_seen) for key, e in self.seen.items()}
+
+
+def _describe(key):
+    return "{} @ {}:{} in {}".format(*key)
+
+
+def _stamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds).isoformat(" ", "seconds")
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_log(filename, flush_interval=5.0):
+    """One ErrorLog per file, shared by every function logging to it."""
+    with _logs_lock:
+        log = _logs.get(filename)
+        if log is None:
+            log = _logs[filename] = ErrorLog(filename, flush_interval)
+        return log
+
+
+@atexit.register
+def flush_all():
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        log.close()
+
+
+def log_errors(filename="errors.log", flush_interval=5.0, reraise=False):
+    def decorator(func):
+        log = get_log(filename, flush_interval)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if log.record(e, func.__name__, flush=False):
+                        print("An error occurred. Check logs for details.")
+                    if log.claim_flush():
+                        # the file write happens on a worker thread, not on the loop
+                        asyncio.get_running_loop().run_in_executor(None, log.flush)
+                    if reraise:
+                        raise
+            async_wrapper.error_log = log
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if log.record(e, func.__name__):
+                    print("An error occurred. Check logs for details.")
+                if reraise:
+                    raise
+        wrapper.error_log = log
+        return wrapper
+    return decorator
+
+
+if __name__ == "__main__":
+    import contextlib
+    import os
+    import tempfile
+
+    def old_log_errors(filename="errors.log"):
+        # the decorator from decorators2.py
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    with open(filename, "a") as f:
+                        f.write(f"Error in {func.__name__}: {str(e)}\n")
+                        f.write(traceback.format_exc() + "\n")
+                    print("An error occurred. Check logs for details.")
+            return wrapper
+        return decorator
+
+    def risky_function():
+        return 1 / 0
+
+    failures = 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, decorate in [("old log_errors", old_log_errors),
+                                ("deduplicated", log_errors)]:
+            path = os.path.join(tmp, label.replace(" ", "_") + ".log")
+            f = decorate(path)(risky_function)
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                for _ in range(failures):
+                    f()
+            flush_all()
+            elapsed = time.perf_counter() - start
+            print("{:<16} {:>7.1f} us per failure, log file {:>10,} bytes".format(
+                label, elapsed / failures * 10**6, os.path.getsize(path)))
+            if label == "deduplicated":
+                with open(path) as log:
+                    print(log.read().splitlines()[-1])
+
+        # a lone error with nothing after it still reaches the file before exit
+        path = os.path.join(tmp, "lone.log")
+        lone = get_log(path, flush_interval=0.05)
+        try:
+            risky_function()
+        except ZeroDivisionError as e:
+            lone.record(e, "risky_function")
+        time.sleep(0.2)
+        with open(path) as log:
+            assert " FIRST ZeroDivisionError " in log.read()
@@ -0,0 +1,260 @@
+"""
+FileManager on a shared pool of open files.
+
+FileManager.file_path in property2.py runs os.path.join on every access, and
+the code that uses it does
+
+    with open(fm.file_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(size)
+
+so each read is an open(), a seek, a read and a close(): four system calls
+(plus Python file object setup) for one read.
+
+FilePool keeps up to `max_open` file descriptors open, shared by every
+FileManager:
+    - a descriptor is looked up by path in an OrderedDict; a hit moves it to the
+      end, so the front is always the least recently used
+    - each descriptor has a reference count. FileManager holds a reference only
+      for the duration of a read or write, and only unreferenced descriptors are
+      closed when the pool is over its limit
+    - reads and writes use os.pread / os.pwrite, which take the offset as an
+      argument instead of using the file position, so any number of threads can
+      share one descriptor without seeking over each other
+    - reads use a read-only descriptor and writes a separate write-only one, so
+      reading a missing file raises FileNotFoundError instead of creating it, and
+      read-only files can be read. Writes create the file (create=False to not)
+
+    fm = FileManager("/var/data", "users.bin")
+    fm.file_path                  # computed when the path is set, not on every access
+    fm.write(b"hello", offset=0)
+    fm.read(5, offset=0)
+
+Run this file for the system call counts over a few thousand files.
+"""
+import collections
+import os
+import threading
+
+_BINARY = getattr(os, "O_BINARY", 0)
+
+
+class _Handle:
+    __slots__ = ("key", "fd", "refs", "lock")
+
+    def __init__(self, key, fd):
+        self.key = key          # (path, "r" or "w")
+        self.fd = fd
+        self.refs = 0
+        self.lock = None if hasattr(os, "pread") else threading.Lock()
+
+
+class FilePool:
+    def __init__(self, max_open=256, create=True, mode=0o644):
+        self.max_open = max_open
+        self.flags = {"r": os.O_RDONLY | _BINARY,
+                      "w": os.O_WRONLY | _BINARY | (os.O_CREAT if create else 0)}
+        self.mode = mode
+        self._handles = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.opens = self.closes = self.hits = 0
+
+    def acquire(self, path, access="r"):
+        key = (path, access)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                self._handles.move_to_end(key)
+                self.hits += 1
+            else:
+                handle = self._handles[key] = _Handle(key, os.open(path, self.flags[access], self.mode))
+                self.opens += 1
+                self._evict()
+            handle.refs += 1
+            return handle
+
+    def release(self, handle):
+        with self._lock:
+            handle.refs -= 1
+            if len(self._handles) > self.max_open:
+                self._evict()
+
+    def _evict(self):
+        # close least recently used descriptors nobody is using right now;
+        # if they are all in use the pool stays over its limit until released
+        excess = len(self._handles) - self.max_open
+        if excess <= 0:
+            return
+        victims = []
+        for handle in self._handles.values():
+            if handle.refs == 0:
+                victims.append(handle)
+                if len(victims) == excess:
+                    break
+        for handle in victims:
+            del self._handles[handle.key]
+            os.close(handle.fd)
+            self.closes += 1
+
+    def pread(self, path, size, offset):
+        handle = self.acquire(path)
+        try:
+            if handle.lock is None:
+                return os.pread(handle.fd, size, offset)
+            with handle.lock:
+                os.lseek(handle.fd, offset, os.SEEK_SET)
+                return os.read(handle.fd, size)
+        finally:
+            self.release(handle)
+
+    def pwrite(self, path, data, offset):
+        handle = self.acquire(path, "w")
+        try:
+            if handle.lock is None:
+                return os.pwrite(handle.fd, data, offset)
+            with handle.lock:
+                os.lseek(handle.fd, offset, os.SEEK_SET)
+                return os.write(handle.fd, data)
+        finally:
+            self.release(handle)
+
+    def size(self, path):
+        handle = self.acquire(path)
+        try:
+            return os.fstat(handle.fd).st_size
+        finally:
+            self.release(handle)
+
+    def discard(self, path):
+        """Closes the descriptors for `path` if they are open and unused (e.g. before deleting the file)."""
+        with self._lock:
+            for access in "rw":
+                handle = self._handles.get((path, access))
+                if handle is not None and handle.refs == 0:
+                    del self._handles[path, access]
+                    os.close(handle.fd)
+                    self.closes += 1
+
+    def close(self):
+        with self._lock:
+            for handle in self._handles.values():
+                os.close(handle.fd)
+                self.closes += 1
+            self._handles.clear()
+
+    def __len__(self):
+        return len(self._handles)
+
+    def stats(self):
+        return {"open": len(self._handles), "opens": self.opens, "closes": self.closes, "hits": self.hits}
+
+
+default_pool = FilePool()
+
+
+class FileManager:
+    def __init__(self, base_directory, filename, pool=None):
+        self.pool = pool if pool is not None else default_pool
+        self._base_directory = base_directory
+        self._filename = filename
+        self._path = os.path.join(base_directory, filename)
+
+    @property
+    def base_directory(self):
+        return self._base_directory
+
+    @base_directory.setter
+    def base_directory(self, value):
+        self._base_directory = value
+        self._path = os.path.join(value, self._filename)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @filename.setter
+    def filename(self, value):
+        self._filename = value
+        self._path = os.path.join(self._base_directory, value)
+
+    @property
+    def file_path(self):
+        """Returns the full file path."""
+        return self._path
+
+    @file_path.setter
+    def file_path(self, new_path):
+        """Allows setting both base directory and filename from a full path."""
+        self._base_directory, self._filename = os.path.split(new_path)
+        self._path = new_path
+
+    def read(self, size=-1, offset=0):
+        if size < 0:
+            size = self.pool.size(self._path) - offset
+        return self.pool.pread(self._path, size, offset)
+
+    def write(self, data, offset=0):
+        return self.pool.pwrite(self._path, data, offset)
+
+    def size(self):
+        return self.pool.size(self._path)
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import time
+
+    files, touches, record = 4000, 100000, 64
+    with tempfile.TemporaryDirectory() as tmp:
+        names = ["{:05d}.bin".format(i) for i in range(files)]
+        for name in names:
+            with open(os.path.join(tmp, name), "wb") as f:
+                f.write(os.urandom(record * 16))
+        rng = random.Random(5)
+        # a skewed workload: most reads go to a few hundred hot files
+        workload = [(names[min(int(rng.paretovariate(1.2)) - 1, files - 1) if rng.random() < 0.9
+                     else rng.randrange(files)], rng.randrange(16) * record)
+                    for _ in range(touches)]
+
+        start = time.perf_counter()
+        for name, offset in workload:
+            with open(os.path.join(tmp, name), "rb") as f:
+                f.seek(offset)
+                f.read(record)
+        plain = time.perf_counter() - start
+        print("{:,} reads over {:,} files".format(touches, files))
+        print("{:<24} {:>8.2f}s {:>10,} opens {:>10,} system calls".format(
+            "open/seek/read/close", plain, touches, touches * 4))
+
+        for max_open in (64, 512, files):
+            pool = FilePool(max_open=max_open)
+            managers = {name: FileManager(tmp, name, pool) for name in names}
+            start = time.perf_counter()
+            for name, offset in workload:
+                managers[name].read(record, offset)
+            elapsed = time.perf_counter() - start
+            syscalls = pool.opens + pool.closes + touches
+            print("{:<24} {:>8.2f}s {:>10,} opens {:>10,} system calls".format(
+                "pool max_open={}".format(max_open), elapsed, pool.opens, syscalls))
+            pool.close()
+
+        # many threads sharing descriptors: pread never moves a shared file position
+        pool = FilePool(max_open=32)
+        fm = FileManager(tmp, names[0], pool)
+        expected = open(fm.file_path, "rb").read()
+        errors = []
+
+        def reader():
+            for _ in range(2000):
+                offset = rng.randrange(16) * record
+                if fm.read(record, offset) != expected[offset:offset + record]:
+                    errors.append(offset)
+
+        threads = [threading.Thread(target=reader) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print("8 threads on one shared descriptor: {} bad reads, {}".format(len(errors), pool.stats()))
+        pool.close()
@@ -0,0 +1,277 @@
+"""
+A ledger that many threads can post transactions to at once.
+
+BankAccount.withdraw in property2.py does
+
+    if amount > self.balance:
+        raise ValueError("Insufficient funds")
+    self.balance -= amount
+
+Two threads can both pass the check before either subtracts, and the
+balance goes negative. Account in property1.py has the same read-check-write
+in `a.balance = a.balance - x`. Both also take one transaction per call.
+
+Ledger keeps every balance in one dict and guards them with lock striping:
+`stripes` locks, and an account always uses lock number hash(account) % stripes.
+
+    - the check and the write happen under the account's lock, so the
+      no-negative-balance rule can't be broken by a race
+    - threads working on accounts in different stripes don't wait for each other
+      (one global lock would make every thread queue behind every other one)
+    - a transfer takes both stripe locks, lowest number first, so two transfers
+      in opposite directions can't deadlock
+
+Transactions are (source, target, amount) tuples: source None is a deposit,
+target None is a withdrawal, both set is a transfer.
+
+    ledger = Ledger()
+    ledger.open("alice", 100)
+    ledger.open("bob")
+    result = ledger.apply_batch([
+        (None, "alice", 50),     # deposit
+        ("alice", "bob", 120),   # transfer
+        ("bob", None, 500),      # withdrawal, rejected: insufficient funds
+    ])
+    result.applied, result.rejected   # 2, [(2, InsufficientFunds(...))]
+
+ledger.account("alice") gives back the BankAccount API (balance, deposit,
+withdraw) on top of the ledger. Run this file for transactions/sec as the
+thread and account counts change.
+
+With the GIL only one thread runs Python code at a time, so on a regular
+CPython build the striped ledger is about as fast as one global lock (a
+transfer between stripes even pays for a second lock). Striping starts paying
+off on a free-threaded build with several cores, where one global lock would
+make the threads take turns.
+"""
+import threading
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+class BatchResult:
+    """How a batch went: the number applied and (index, error) for each rejection."""
+
+    __slots__ = ("applied", "rejected")
+
+    def __init__(self):
+        self.applied = 0
+        self.rejected = []
+
+    def __repr__(self):
+        return "BatchResult(applied={}, rejected={})".format(self.applied, len(self.rejected))
+
+
+class AccountView:
+    """One account inside a Ledger, with BankAccount's methods."""
+
+    __slots__ = ("_ledger", "owner")
+
+    def __init__(self, ledger, owner):
+        self._ledger = ledger
+        self.owner = owner
+
+    @property
+    def balance(self):
+        return self._ledger.balance(self.owner)
+
+    def deposit(self, amount):
+        self._ledger.deposit(self.owner, amount)
+
+    def withdraw(self, amount):
+        self._ledger.withdraw(self.owner, amount)
+
+    def __repr__(self):
+        return "AccountView({!r}, balance={})".format(self.owner, self.balance)
+
+
+class Ledger:
+    def __init__(self, stripes=64):
+        self._balances = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stripes = stripes
+        self._open_lock = threading.Lock()
+
+    def open(self, owner, balance=0):
+        if balance < 0:
+            raise ValueError("Balance cannot be negative")
+        with self._open_lock:
+            if owner in self._balances:
+                raise ValueError("account {!r} already exists".format(owner))
+            self._balances[owner] = balance
+        return AccountView(self, owner)
+
+    def account(self, owner):
+        if owner not in self._balances:
+            raise KeyError(owner)
+        return AccountView(self, owner)
+
+    def balance(self, owner):
+        return self._balances[owner]
+
+    def total(self):
+        """Sum of every balance, taken with all locks held so no transfer is half done."""
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            return sum(self._balances.values())
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def __len__(self):
+        return len(self._balances)
+
+    def _lock(self, owner):
+        return self._locks[hash(owner) % self._stripes]
+
+    def deposit(self, owner, amount):
+        self._post(None, owner, amount)
+
+    def withdraw(self, owner, amount):
+        self._post(owner, None, amount)
+
+    def transfer(self, source, target, amount):
+        self._post(source, target, amount)
+
+    def _post(self, source, target, amount):
+        if amount <= 0:
+            raise ValueError("Amount must be positive")
+        balances = self._balances
+        if source is None:
+            with self._lock(target):
+                balances[target] += amount
+            return
+        if target is None:
+            with self._lock(source):
+                if amount > balances[source]:
+                    raise InsufficientFunds("Insufficient funds")
+                balances[source] -= amount
+            return
+
+        if target not in balances:
+            raise KeyError(target)
+        first = hash(source) % self._stripes
+        second = hash(target) % self._stripes
+        if first == second:
+            locks = (self._locks[first],)
+        else:
+            locks = (self._locks[min(first, second)], self._locks[max(first, second)])
+        for lock in locks:
+            lock.acquire()
+        try:
+            if amount > balances[source]:
+                raise InsufficientFunds("Insufficient funds")
+            balances[source] -= amount
+            balances[target] += amount
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def apply_batch(self, transactions):
+        """Applies (source, target, amount) tuples in order; bad ones are skipped and reported."""
+        result = BatchResult()
+        post = self._post
+        for index, (source, target, amount) in enumerate(transactions):
+            try:
+                post(source, target, amount)
+            except (ValueError, KeyError) as e:
+                result.rejected.append((index, e))
+            else:
+                result.applied += 1
+        return result
+
+
+class GlobalLockLedger(Ledger):
+    """The same ledger with a single lock, to compare against."""
+
+    def __init__(self):
+        super().__init__(stripes=1)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    def make_batches(accounts, threads, per_thread, seed=7):
+        rng = random.Random(seed)
+        batches = []
+        for _ in range(threads):
+            batch = []
+            for _ in range(per_thread):
+                kind = rng.random()
+                a, b = rng.randrange(accounts), rng.randrange(accounts)
+                amount = rng.randint(1, 200)
+                if kind < 0.2:
+                    batch.append((None, a, amount))
+                elif kind < 0.4:
+                    batch.append((a, None, amount))
+                elif a != b:
+                    batch.append((a, b, amount))
+                else:
+                    batch.append((None, a, amount))
+            batches.append(batch)
+        return batches
+
+    def run(ledger_class, accounts, batches):
+        ledger = ledger_class()
+        for i in range(accounts):
+            ledger.open(i, 1000)
+        expected = 1000 * accounts + sum(
+            (amount if source is None else -amount if target is None else 0)
+            for batch in batches for source, target, amount in batch)
+        results = [None] * len(batches)
+
+        def worker(i):
+            results[i] = ledger.apply_batch(batches[i])
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(len(batches))]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+
+        # rejected withdrawals never took money out
+        for batch, result in zip(batches, results):
+            for index, _ in result.rejected:
+                source, target, amount = batch[index]
+                if target is None:
+                    expected += amount
+        assert ledger.total() == expected
+        assert min(ledger.balance(i) for i in range(accounts)) >= 0
+        return sum(len(b) for b in batches) / elapsed
+
+    # a race check first: 8 threads withdrawing from one account
+    ledger = Ledger()
+    shared = ledger.open("shared", 1000)
+    done = []
+
+    def drain():
+        for _ in range(1000):
+            try:
+                shared.withdraw(1)
+                done.append(1)
+            except InsufficientFunds:
+                pass
+
+    threads = [threading.Thread(target=drain) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print("8 threads x 1000 withdrawals of 1 from 1000: {} succeeded, balance {}".format(
+        len(done), shared.balance))
+
+    total = 200000
+    print("{:>8} {:>8} {:>16} {:>16}".format("threads", "accounts", "global lock tx/s", "striped tx/s"))
+    for accounts in (16, 10000):
+        for threads in (1, 2, 4, 8):
+            batches = make_batches(accounts, threads, total // threads)
+            print("{:>8} {:>8} {:>16,.0f} {:>16,.0f}".format(
+                threads, accounts,
+                run(GlobalLockLedger, accounts, batches),
+                run(Ledger, accounts, batches)))
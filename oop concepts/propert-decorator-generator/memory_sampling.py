@@ -0,0 +1,229 @@
+"""
+Sampling, nesting safe memory profiler.
+
+memory_profiler() in decorator1.py does tracemalloc.start() / stop() around
+every call. Tracing makes every allocation slower (often 5-10x for
+allocation heavy code) and the inner stop() of a nested decorated call ends
+tracing for the outer call too, so the outer numbers are garbage.
+
+@memory_sampled(every=N) only traces 1 call in N. Tracing is started by the
+first sampled call and stopped when the outermost one returns (and left alone
+if somebody else had already started it). Each call keeps its own frame on a
+stack so nested calls work:
+
+    on entry -> fold the global peak into the parent frame, reset_peak()
+    on exit  -> this call's peak = max(own running peak, global peak)
+                then fold it into the parent, because the parent was alive too
+
+With top_sites=N the sampled calls also diff a tracemalloc snapshot taken on
+entry and exit, and the biggest allocation sites are summed per function.
+
+    @memory_sampled(every=100, top_sites=5)
+    def create_large_list():
+        return [i for i in range(10**6)]
+
+    print(report())
+
+tracemalloc is process wide, so allocations made by other threads while a
+sampled call is running are counted against it.
+"""
+import functools
+import threading
+import time
+import tracemalloc
+
+
+class MemoryStats:
+    """What we know about one function's sampled calls."""
+
+    def __init__(self, name, top_sites):
+        self.name = name
+        self.top_sites = top_sites
+        self.calls = 0
+        self.sampled = 0
+        self.total_net = 0
+        self.max_peak = 0
+        self.total_peak = 0
+        self.sites = {}
+
+    def add(self, net, peak, site_diffs):
+        self.sampled += 1
+        self.total_net += net
+        self.total_peak += peak
+        if peak > self.max_peak:
+            self.max_peak = peak
+        for site, size in site_diffs:
+            self.sites[site] = self.sites.get(site, 0) + size
+
+    def summary(self):
+        sampled = self.sampled or 1
+        top = sorted(self.sites.items(), key=lambda item: item[1], reverse=True)
+        return {
+            "calls": self.calls,
+            "sampled": self.sampled,
+            "mean_net_bytes": self.total_net // sampled,
+            "mean_peak_bytes": self.total_peak // sampled,
+            "max_peak_bytes": self.max_peak,
+            "top_sites": [
+                {"site": "{}:{}".format(*site), "bytes": size // sampled}
+                for site, size in top[:self.top_sites]
+            ],
+        }
+
+
+class _Frame:
+    __slots__ = ("start", "peak", "snapshot")
+
+    def __init__(self, start, snapshot):
+        self.start = start
+        self.peak = start
+        self.snapshot = snapshot
+
+
+# keep tracemalloc's own bookkeeping out of the top sites
+_SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+_registry = {}
+_lock = threading.Lock()
+_local = threading.local()
+_active = 0            # sampled calls currently running, all threads
+_we_started = False    # did we call tracemalloc.start()?
+
+
+def _stack():
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def _enter(take_snapshot):
+    global _active, _we_started
+    with _lock:
+        if _active == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _we_started = True
+        _active += 1
+
+    stack = _stack()
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        parent = stack[-1]
+        parent.peak = max(parent.peak, peak)
+    tracemalloc.reset_peak()
+    snapshot = None
+    if take_snapshot:
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    frame = _Frame(current, snapshot)
+    stack.append(frame)
+    return frame
+
+
+def _exit(frame):
+    global _active, _we_started
+    stack = _stack()
+    current, peak = tracemalloc.get_traced_memory()
+    frame.peak = max(frame.peak, peak)
+    site_diffs = ()
+    if frame.snapshot is not None:
+        after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        diff = after.compare_to(frame.snapshot, "lineno")
+        site_diffs = [
+            ((stat.traceback[0].filename, stat.traceback[0].lineno), stat.size_diff)
+            for stat in diff if stat.size_diff > 0
+        ]
+    stack.pop()
+    if stack:
+        parent = stack[-1]
+        parent.peak = max(parent.peak, frame.peak)
+
+    with _lock:
+        _active -= 1
+        if _active == 0 and _we_started:
+            tracemalloc.stop()
+            _we_started = False
+    return current - frame.start, frame.peak - frame.start, site_diffs
+
+
+def memory_sampled(func=None, *, every=100, top_sites=0, name=None):
+    """Decorator: trace the memory of 1 call in `every`, print nothing."""
+    if func is None:
+        return lambda f: memory_sampled(f, every=every, top_sites=top_sites, name=name)
+
+    key = name or "{}.{}".format(func.__module__, func.__qualname__)
+    with _lock:
+        stats = _registry.setdefault(key, MemoryStats(key, top_sites))
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats.calls += 1
+        if stats.calls % every:
+            return func(*args, **kwargs)
+        frame = _enter(top_sites > 0)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.add(*_exit(frame))
+
+    wrapper.memory_stats = stats
+    return wrapper
+
+
+def snapshot():
+    with _lock:
+        items = list(_registry.items())
+    return {name: stats.summary() for name, stats in items}
+
+
+def report():
+    lines = []
+    for name, s in sorted(snapshot().items()):
+        lines.append("{}: {} calls, {} sampled, mean peak {:.2f}MB, max peak {:.2f}MB".format(
+            name, s["calls"], s["sampled"], s["mean_peak_bytes"] / 10**6,
+            s["max_peak_bytes"] / 10**6))
+        for site in s["top_sites"]:
+            lines.append("    {:>12,} B  {}".format(site["bytes"], site["site"]))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    def memory_profiler(func):
+        # the old decorator from decorator1.py, without the print
+        def wrapper(*args, **kwargs):
+            tracemalloc.start()
+            result = func(*args, **kwargs)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return result
+        return wrapper
+
+    def make_dicts():
+        return [{"i": i} for i in range(2000)]
+
+    calls = 2000
+    for label, f in [("bare", make_dicts),
+                     ("memory_profiler (every call)", memory_profiler(make_dicts)),
+                     ("memory_sampled(every=100)", memory_sampled(make_dicts, every=100,
+                                                                  name="overhead"))]:
+        start = time.perf_counter()
+        for _ in range(calls):
+            f()
+        elapsed = time.perf_counter() - start
+        print("{:<30} {:>8.1f} us per call".format(label, elapsed / calls * 10**6))
+    print()
+
+    @memory_sampled(every=1, top_sites=3)
+    def build_rows(n):
+        return [str(i) * 3 for i in range(n)]
+
+    @memory_sampled(every=1, top_sites=3)
+    def outer():
+        # a temporary 1M element list, freed before the inner call
+        temp = list(range(10**6))
+        del temp
+        return build_rows(10**5)
+
+    outer()
+    outer()
+    print(report())
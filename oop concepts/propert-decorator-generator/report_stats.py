@@ -0,0 +1,196 @@
+"""
+Report with statistics kept up to date in O(1) per data point.
+
+Report.summary in property2.py recomputes sum(self.data) / len(self.data)
+over the whole list whenever the cache is cleared. Our reports get a steady
+stream of new points, so every new point costs O(n).
+
+StreamingReport updates its statistics as values come and go:
+
+    count, mean, variance -> Welford's update on append, and the same update
+                             run backwards on removal
+    min, max              -> monotonic deques: the max deque only keeps values
+                             that could still become the max once older values
+                             are removed (same for min), so both are O(1) amortized
+
+Values are removed oldest first: call popleft(), or give max_size and the
+report keeps a sliding window of the last max_size points.
+
+    r = StreamingReport(max_size=1000)
+    for reading in stream:
+        r.append(reading)
+        r.summary          # mean, like Report.summary
+        r.stats()          # count / mean / variance / min / max
+
+Running the update backwards loses a little precision every time, so every
+`resync_every` removals the sums are rebuilt from the data (O(n), but rare
+enough to stay O(1) amortized). Run this file for the check against a full
+recompute.
+"""
+import collections
+import math
+
+
+class StreamingReport:
+    def __init__(self, data=(), max_size=None, resync_every=100000):
+        self.max_size = max_size
+        self.resync_every = resync_every
+        self.data = data
+
+    @property
+    def data(self):
+        """The current values, oldest first. Don't modify it in place."""
+        return self._data
+
+    @data.setter
+    def data(self, values):
+        # replacing the data (like Report.data = ...) rebuilds everything
+        self._data = collections.deque()
+        self._max = collections.deque()
+        self._min = collections.deque()
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._removed = 0
+        for value in values:
+            self.append(value)
+
+    def append(self, value):
+        self._data.append(value)
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+
+        while self._max and self._max[-1] < value:
+            self._max.pop()
+        self._max.append(value)
+        while self._min and self._min[-1] > value:
+            self._min.pop()
+        self._min.append(value)
+
+        if self.max_size is not None and self._count > self.max_size:
+            self.popleft()
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def popleft(self):
+        """Removes and returns the oldest value."""
+        value = self._data.popleft()
+        self._count -= 1
+        if self._count == 0:
+            self._mean = self._m2 = 0.0
+        else:
+            delta = value - self._mean
+            self._mean -= delta / self._count
+            self._m2 -= delta * (value - self._mean)
+            if self._m2 < 0:
+                self._m2 = 0.0
+
+        if self._max[0] == value:
+            self._max.popleft()
+        if self._min[0] == value:
+            self._min.popleft()
+
+        self._removed += 1
+        if self._removed >= self.resync_every:
+            self.resync()
+        return value
+
+    def resync(self):
+        """Rebuilds mean and variance from the data with a two-pass sum."""
+        self._removed = 0
+        n = self._count
+        if not n:
+            self._mean = self._m2 = 0.0
+            return
+        mean = math.fsum(self._data) / n
+        self._mean = mean
+        self._m2 = math.fsum((x - mean) ** 2 for x in self._data)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def summary(self):
+        """The mean, like Report.summary, but never recomputed from scratch."""
+        if not self._count:
+            raise ZeroDivisionError("summary of an empty report")
+        return self._mean
+
+    @property
+    def variance(self):
+        return self._m2 / self._count if self._count else 0.0
+
+    @property
+    def sample_variance(self):
+        return self._m2 / (self._count - 1) if self._count > 1 else 0.0
+
+    @property
+    def min(self):
+        return self._min[0]
+
+    @property
+    def max(self):
+        return self._max[0]
+
+    def stats(self):
+        return {
+            "count": self._count,
+            "mean": self._mean,
+            "variance": self.variance,
+            "min": self.min if self._count else None,
+            "max": self.max if self._count else None,
+        }
+
+
+def full_recompute(data):
+    data = list(data)
+    n = len(data)
+    mean = math.fsum(data) / n
+    return {
+        "count": n,
+        "mean": mean,
+        "variance": math.fsum((x - mean) ** 2 for x in data) / n,
+        "min": min(data),
+        "max": max(data),
+    }
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    rng = random.Random(42)
+    window = 10000
+    points = [rng.gauss(1e6, 50) for _ in range(300000)]
+
+    r = StreamingReport(max_size=window)
+    worst = {"mean": 0.0, "variance": 0.0}
+    start = time.perf_counter()
+    for i, x in enumerate(points):
+        r.append(x)
+        if i % 25000 == 0 and i:
+            expected = full_recompute(r.data)
+            got = r.stats()
+            assert got["count"] == expected["count"]
+            assert got["min"] == expected["min"] and got["max"] == expected["max"]
+            for key in worst:
+                error = abs(got[key] - expected[key]) / abs(expected[key])
+                worst[key] = max(worst[key], error)
+    streaming = time.perf_counter() - start
+    assert worst["mean"] < 1e-9 and worst["variance"] < 1e-6, worst
+
+    print("{} points, window {}: {:.2f}s incremental".format(len(points), window, streaming))
+    print("worst relative error vs full recompute: mean {:.1e}, variance {:.1e}".format(
+        worst["mean"], worst["variance"]))
+
+    data = collections.deque(maxlen=window)
+    start = time.perf_counter()
+    for x in points[:20000]:
+        data.append(x)
+        sum(data) / len(data)
+    print("the old recompute per point, first 20000 points only: {:.2f}s".format(
+        time.perf_counter() - start))
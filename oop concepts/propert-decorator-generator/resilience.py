@@ -0,0 +1,324 @@
+"""
+Retry with exponential backoff, full jitter, a retry budget and a circuit breaker.
+
+retry(max_retries=3) in decorators2.py retries straight away and
+retry_decorator in decorator1.py always retries 3 times. When the thing we
+call is already struggling, every failed call turns into 3-4 calls, which is
+exactly the extra load that keeps it down (a retry storm).
+
+@resilient fixes that in three layers:
+    backoff  -> wait random.uniform(0, min(max_delay, base_delay * 2**attempt))
+                between attempts ("full jitter"), so clients don't retry in sync
+    budget   -> RetryBudget lets retries be at most `ratio` of the calls made,
+                once it is spent failures are raised instead of retried
+    breaker  -> CircuitBreaker stops calling at all after `failure_threshold`
+                failures in a row and lets one trial call through after
+                `reset_timeout` seconds
+
+Works the same for `async def` functions (it awaits asyncio.sleep instead of
+blocking the event loop).
+
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+
+    @resilient(max_retries=3, base_delay=0.1, budget=RetryBudget(0.2), breaker=breaker)
+    def fetch_data():
+        ...
+
+Run this file to see the simulated load amplification of each strategy.
+"""
+import asyncio
+import functools
+import inspect
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the function while the breaker is open."""
+
+
+class RetryBudget:
+    """Token bucket: every call deposits `ratio` tokens, every retry spends one."""
+
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(min_tokens)
+        self.calls = 0
+        self.retries = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+
+class CircuitBreaker:
+    """closed -> open after N failures in a row -> half open after a timeout."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                # only one trial call at a time while half open
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        """Returns the state after this failure."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+            self._trial_running = False
+            return self.state
+
+    def release(self):
+        """The call ended without saying anything about the dependency (it was
+        cancelled, or raised an error we don't retry): let the next trial through."""
+        with self._lock:
+            self._trial_running = False
+
+
+def backoff_delay(attempt, base_delay, max_delay, rng=random):
+    """Full jitter: uniform between 0 and the capped exponential delay."""
+    return rng.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def resilient(max_retries=3, base_delay=0.1, max_delay=10.0, retry_on=(Exception,),
+              budget=None, breaker=None, sleep=time.sleep, rng=random):
+    def decorator(func):
+        def before_call():
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError("circuit open for {}".format(func.__name__))
+
+        def on_failure(attempt):
+            # returns the delay before the next attempt, or None to give up
+            if breaker is not None and breaker.record_failure() != breaker.CLOSED:
+                # the next before_call() would only raise CircuitOpenError over the
+                # real error, after a wasted sleep and budget token
+                return None
+            if attempt >= max_retries:
+                return None
+            if budget is not None and not budget.try_spend():
+                return None
+            return backoff_delay(attempt, base_delay, max_delay, rng)
+
+        def on_success():
+            if breaker is not None:
+                breaker.record_success()
+
+        def on_other_error():
+            # without this a half-open breaker would wait for its trial forever
+            if breaker is not None:
+                breaker.release()
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if budget is not None:
+                    budget.record_call()
+                attempt = 0
+                while True:
+                    before_call()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except retry_on:
+                        delay = on_failure(attempt)
+                        if delay is None:
+                            raise
+                        attempt += 1
+                        await asyncio.sleep(delay)
+                    except BaseException:      # not retried, e.g. CancelledError
+                        on_other_error()
+                        raise
+                    else:
+                        on_success()
+                        return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if budget is not None:
+                budget.record_call()
+            attempt = 0
+            while True:
+                before_call()
+                try:
+                    result = func(*args, **kwargs)
+                except retry_on:
+                    delay = on_failure(attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    sleep(delay)
+                except BaseException:
+                    on_other_error()
+                    raise
+                else:
+                    on_success()
+                    return result
+        return wrapper
+    return decorator
+
+
+# ------------------------------------------- simulation -----------------------------------------
+class SimulatedDependency:
+    """Fails every call during the outage window, and `error_rate` of the rest."""
+
+    def __init__(self, clock, outage_start, outage_end, error_rate=0.02, rng=None):
+        self.clock = clock
+        self.outage_start = outage_start
+        self.outage_end = outage_end
+        self.error_rate = error_rate
+        self.rng = rng or random.Random(1)
+        self.attempts = 0
+        self.outage_attempts = 0
+
+    def __call__(self):
+        self.attempts += 1
+        now = self.clock.now
+        if self.outage_start <= now < self.outage_end:
+            self.outage_attempts += 1
+            raise ConnectionError("dependency down")
+        if self.rng.random() < self.error_rate:
+            raise ConnectionError("random failure")
+        return "ok"
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def naive_retry(max_retries=3):
+    # decorators2.py retry() with real exceptions and no sleep
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_retries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    if attempt == max_retries:
+                        raise
+        return wrapper
+    return decorator
+
+
+def simulate(strategy, calls=20000, interval=0.01, outage=(60.0, 120.0)):
+    """One call every `interval` seconds of virtual time, outage in the middle."""
+    clock = VirtualClock()
+    dependency = SimulatedDependency(clock, *outage)
+    rng = random.Random(2)
+
+    def fetch_data():
+        return dependency()
+
+    if strategy == "naive":
+        call = naive_retry(3)(fetch_data)
+    elif strategy == "backoff":
+        call = resilient(3, base_delay=0.05, sleep=clock.sleep, rng=rng)(fetch_data)
+    elif strategy == "backoff+budget":
+        call = resilient(3, base_delay=0.05, sleep=clock.sleep, rng=rng,
+                         budget=RetryBudget(0.1))(fetch_data)
+    else:
+        call = resilient(3, base_delay=0.05, sleep=clock.sleep, rng=rng,
+                         budget=RetryBudget(0.1),
+                         breaker=CircuitBreaker(5, reset_timeout=1.0, clock=clock))(fetch_data)
+
+    ok = outage_calls = 0
+    for i in range(calls):
+        # every logical call arrives on schedule, its retries move time on from there
+        clock.now = i * interval
+        if outage[0] <= clock.now < outage[1]:
+            outage_calls += 1
+        try:
+            call()
+            ok += 1
+        except (ConnectionError, CircuitOpenError):
+            pass
+
+    return {
+        "strategy": strategy,
+        "attempts_per_call": dependency.attempts / calls,
+        "outage_amplification": dependency.outage_attempts / max(outage_calls, 1),
+        "success_rate": ok / calls,
+    }
+
+
+if __name__ == "__main__":
+    print("{:<24} {:>18} {:>21} {:>13}".format(
+        "strategy", "attempts per call", "load during outage", "success rate"))
+    for strategy in ("naive", "backoff", "backoff+budget", "backoff+budget+breaker"):
+        r = simulate(strategy)
+        print("{:<24} {:>18.2f} {:>20.2f}x {:>12.1%}".format(
+            r["strategy"], r["attempts_per_call"], r["outage_amplification"], r["success_rate"]))
+
+    async def flaky(state={"n": 0}):
+        state["n"] += 1
+        if state["n"] < 3:
+            raise ConnectionError("try again")
+        return "async ok after {} attempts".format(state["n"])
+
+    print(asyncio.run(resilient(max_retries=5, base_delay=0.01)(flaky)()))
+
+    # the failure that opens the breaker is raised as is, without sleeping first
+    sleeps = []
+    budget = RetryBudget()
+
+    @resilient(max_retries=3, budget=budget, breaker=CircuitBreaker(failure_threshold=1),
+               sleep=sleeps.append)
+    def broken():
+        raise ConnectionError("down")
+
+    try:
+        broken()
+    except ConnectionError:
+        pass
+    assert sleeps == [] and budget.retries == 0
@@ -0,0 +1,310 @@
+"""
+Circle / Rectangle for millions of shapes.
+
+Circle and Rectangle in property1.py are normal classes: every instance has
+its own __dict__ (~100+ bytes before the numbers themselves) and
+Rectangle.area is worked out one object at a time.
+
+Two steps down in memory:
+
+    SlottedCircle / SlottedRectangle  -> same API, __slots__ instead of __dict__
+    CircleArray / RectangleArray      -> no object per shape at all: each field is
+                                         one contiguous array('d'), 8 bytes a value
+
+The arrays give whole-column properties (areas, circumferences, perimeters).
+With numpy installed they run vectorized over a zero-copy view of the
+array('d') buffer, otherwise they are a plain loop returning an array('d').
+
+Indexing an array gives a light view with the old attribute API, so code
+written for single shapes keeps working:
+
+    circles = CircleArray([1.0, 2.5, 3.0])
+    circles.areas()          # every area at once
+    c = circles[1]           # CircleView
+    c.radius = 4.0           # validated, written straight into the array
+    c.area
+
+Run this file for the memory and throughput comparison.
+"""
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _check_radius(value):
+    if value < 0:
+        raise ValueError("Radius cannot be negative")
+    return value
+
+
+class SlottedCircle:
+    __slots__ = ("_radius",)
+
+    def __init__(self, radius):
+        self.radius = radius
+
+    @property
+    def radius(self):
+        return self._radius
+
+    @radius.setter
+    def radius(self, value):
+        self._radius = _check_radius(value)
+
+    @property
+    def area(self):
+        return math.pi * self._radius ** 2
+
+    @property
+    def circumference(self):
+        return 2 * math.pi * self._radius
+
+
+class SlottedRectangle:
+    __slots__ = ("width", "height")
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    @property
+    def area(self):
+        return self.width * self.height
+
+    @property
+    def perimeter(self):
+        return 2 * (self.width + self.height)
+
+
+def _column(values):
+    """A numpy view of an array('d') (no copy), or the array itself without numpy."""
+    if np is not None:
+        return np.frombuffer(values, dtype=np.float64) if len(values) else np.empty(0)
+    return values
+
+
+class CircleView:
+    """One circle inside a CircleArray."""
+
+    __slots__ = ("_owner", "_index")
+
+    def __init__(self, owner, index):
+        self._owner = owner
+        self._index = index
+
+    @property
+    def radius(self):
+        return self._owner._radius[self._index]
+
+    @radius.setter
+    def radius(self, value):
+        self._owner._radius[self._index] = _check_radius(value)
+
+    @property
+    def area(self):
+        return math.pi * self.radius ** 2
+
+    @property
+    def circumference(self):
+        return 2 * math.pi * self.radius
+
+    def __repr__(self):
+        return "CircleView(radius={})".format(self.radius)
+
+
+class CircleArray:
+    def __init__(self, radii=()):
+        self._radius = array("d")
+        self.extend(radii)
+
+    def __len__(self):
+        return len(self._radius)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._radius)
+        if not 0 <= index < len(self._radius):
+            raise IndexError("CircleArray index out of range")
+        return CircleView(self, index)
+
+    def __iter__(self):
+        return (CircleView(self, i) for i in range(len(self._radius)))
+
+    def append(self, radius):
+        self._radius.append(_check_radius(radius))
+
+    def extend(self, radii):
+        new = array("d", radii)
+        if len(new) and (_column(new).min() if np is not None else min(new)) < 0:
+            raise ValueError("Radius cannot be negative")
+        self._radius.extend(new)
+
+    def radii(self):
+        """A copy of every radius (numpy array if numpy is installed)."""
+        return _column(self._radius).copy() if np is not None else array("d", self._radius)
+
+    def areas(self):
+        r = _column(self._radius)
+        if np is not None:
+            return np.pi * r * r
+        return array("d", (math.pi * x * x for x in r))
+
+    def circumferences(self):
+        r = _column(self._radius)
+        if np is not None:
+            return 2 * np.pi * r
+        return array("d", (2 * math.pi * x for x in r))
+
+    def total_area(self):
+        r = _column(self._radius)
+        if np is not None:
+            return float(np.pi * np.dot(r, r))
+        return math.pi * math.fsum(x * x for x in r)
+
+    def nbytes(self):
+        return self._radius.buffer_info()[1] * self._radius.itemsize
+
+
+class RectangleView:
+    """One rectangle inside a RectangleArray."""
+
+    __slots__ = ("_owner", "_index")
+
+    def __init__(self, owner, index):
+        self._owner = owner
+        self._index = index
+
+    @property
+    def width(self):
+        return self._owner._width[self._index]
+
+    @width.setter
+    def width(self, value):
+        self._owner._width[self._index] = value
+
+    @property
+    def height(self):
+        return self._owner._height[self._index]
+
+    @height.setter
+    def height(self, value):
+        self._owner._height[self._index] = value
+
+    @property
+    def area(self):
+        return self.width * self.height
+
+    @property
+    def perimeter(self):
+        return 2 * (self.width + self.height)
+
+    def __repr__(self):
+        return "RectangleView(width={}, height={})".format(self.width, self.height)
+
+
+class RectangleArray:
+    def __init__(self, widths=(), heights=()):
+        self._width = array("d")
+        self._height = array("d")
+        self.extend(widths, heights)
+
+    def __len__(self):
+        return len(self._width)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._width)
+        if not 0 <= index < len(self._width):
+            raise IndexError("RectangleArray index out of range")
+        return RectangleView(self, index)
+
+    def __iter__(self):
+        return (RectangleView(self, i) for i in range(len(self._width)))
+
+    def append(self, width, height):
+        self._width.append(width)
+        self._height.append(height)
+
+    def extend(self, widths, heights):
+        widths, heights = array("d", widths), array("d", heights)
+        if len(widths) != len(heights):
+            raise ValueError("widths and heights must have the same length")
+        self._width.extend(widths)
+        self._height.extend(heights)
+
+    def areas(self):
+        w, h = _column(self._width), _column(self._height)
+        if np is not None:
+            return w * h
+        return array("d", (a * b for a, b in zip(w, h)))
+
+    def perimeters(self):
+        w, h = _column(self._width), _column(self._height)
+        if np is not None:
+            return 2 * (w + h)
+        return array("d", (2 * (a + b) for a, b in zip(w, h)))
+
+    def total_area(self):
+        w, h = _column(self._width), _column(self._height)
+        if np is not None:
+            return float(np.dot(w, h))
+        return math.fsum(a * b for a, b in zip(w, h))
+
+    def nbytes(self):
+        return sum(a.buffer_info()[1] * a.itemsize for a in (self._width, self._height))
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    import tracemalloc
+
+    class Rectangle:
+        # property1.py
+        def __init__(self, width, height):
+            self.width = width
+            self.height = height
+
+        @property
+        def area(self):
+            return self.width * self.height
+
+    n = 1000000
+    rng = random.Random(1)
+    widths = [rng.uniform(1, 10) for _ in range(n)]
+    heights = [rng.uniform(1, 10) for _ in range(n)]
+
+    def measure(label, build, total):
+        tracemalloc.start()
+        shapes = build()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        result = total(shapes)
+        elapsed = time.perf_counter() - start
+        print("{:<20} {:>8.1f} MB {:>10.1f} ms for the total area ({:.6e})".format(
+            label, memory / 10**6, elapsed * 1000, result))
+
+    print("{} rectangles (numpy {})".format(n, "on" if np is not None else "off"))
+    measure("Rectangle",
+            lambda: [Rectangle(w, h) for w, h in zip(widths, heights)],
+            lambda shapes: sum(r.area for r in shapes))
+    measure("SlottedRectangle",
+            lambda: [SlottedRectangle(w, h) for w, h in zip(widths, heights)],
+            lambda shapes: sum(r.area for r in shapes))
+    measure("RectangleArray",
+            lambda: RectangleArray(widths, heights),
+            lambda shapes: shapes.total_area())
+
+    circles = CircleArray([1.0, 2.5, 3.0])
+    c = circles[1]
+    c.radius = 4.0
+    print(c, round(c.area, 3), [round(float(a), 3) for a in circles.areas()])
+    try:
+        c.radius = -1
+    except ValueError as e:
+        print(e)
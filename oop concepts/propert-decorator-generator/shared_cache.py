@@ -0,0 +1,269 @@
+"""
+Shared memoize cache for pool workers.
+
+The memoize() decorator in decorators2.py keeps a private dict per process,
+so when the decorated function runs inside a multiprocessing.Pool every
+worker builds its own cache and repeats the work the others already did.
+
+shared_memoize() keeps two tiers:
+    L1 -> the same private dict as memoize() (free to read)
+    L2 -> a host wide dict served by a multiprocessing.Manager (a hit is two
+          round trips: the lookup and this process's stats row)
+
+Only one process computes a given key: the first one marks it as pending and
+the others wait for the value to show up instead of computing it again. If the
+owner dies before storing it, a waiter notices and computes the key instead.
+
+Usage:
+    cache = SharedCache()
+    with multiprocessing.Pool(4, initializer=attach, initargs=(cache,)) as pool:
+        pool.map(fibonacci, inputs)
+    print(cache.report())
+
+    # a worker that dies mid-computation doesn't leave the others waiting forever
+    dying = multiprocessing.Process(target=_die_while_computing, args=(cache, "orphan"))
+    dying.start()
+    dying.join()
+    assert cache.get_or_compute("orphan", lambda: 42) == 42
+"""
+import functools
+import multiprocessing
+import os
+import time
+
+_MISSING = object()
+_KWD_MARK = ("__kwargs__",)
+
+# the SharedCache this process reads and writes, set by attach()
+_cache = None
+
+
+class SharedCache:
+    """Host wide cache tier backed by a Manager process (local server stand-in)."""
+
+    def __init__(self, manager=None, poll_interval=0.001, stale_after=None):
+        if manager is None:
+            manager = multiprocessing.Manager()
+            self._manager = manager  # keep the server process alive
+        self._data = manager.dict()
+        self._pending = manager.dict()
+        self._stats = manager.dict()
+        self._lock = manager.Lock()
+        self.poll_interval = poll_interval
+        # seconds after which a waiter stops trusting a live owner too (None: never)
+        self.stale_after = stale_after
+        self._counts_pid = None
+
+    def __getstate__(self):
+        # workers only need the proxies; the Manager itself can't be pickled (spawn)
+        state = self.__dict__.copy()
+        state.pop("_manager", None)
+        state["_counts_pid"] = None
+        return state
+
+    def _count(self, field):
+        # one stats row per process so the counters never race each other; the
+        # counts are kept here and only written, never read back (one round trip)
+        pid = os.getpid()
+        if self._counts_pid != pid:
+            # first count in this process (a forked worker starts with a copy)
+            self._counts_pid = pid
+            self._counts = {"hits": 0, "misses": 0, "waits": 0}
+        self._counts[field] += 1
+        self._stats[pid] = (self._counts["hits"], self._counts["misses"], self._counts["waits"])
+
+    def get_or_compute(self, key, compute):
+        # values are stored as 1-tuples so a missing key (None) never looks
+        # like a cached None, and the lookup stays a single round trip
+        box = self._data.get(key)
+        if box is not None:
+            self._count("hits")
+            return box[0]
+
+        with self._lock:
+            box = self._data.get(key)
+            owner = box is None and key not in self._pending
+            if owner:
+                self._pending[key] = (os.getpid(), time.time())
+
+        if box is not None:
+            self._count("hits")
+            return box[0]
+
+        if owner:
+            try:
+                value = compute()
+                self._data[key] = (value,)
+            finally:
+                self._pending.pop(key, None)
+            self._count("misses")
+            return value
+
+        # another process is computing this key, wait for its result
+        delay = self.poll_interval
+        while True:
+            box = self._data.get(key)
+            if box is not None:
+                self._count("waits")
+                return box[0]
+            marker = self._pending.get(key)
+            if marker is None:
+                # the owner failed, compute it ourselves
+                return self.get_or_compute(key, compute)
+            if self._is_stale(marker):
+                # the owner died (or hung) without clearing its mark: drop the
+                # mark, unless another waiter already replaced it, and start over
+                with self._lock:
+                    if self._pending.get(key) == marker:
+                        del self._pending[key]
+                return self.get_or_compute(key, compute)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def _is_stale(self, marker):
+        pid, started = marker
+        if self.stale_after is not None and time.time() - started > self.stale_after:
+            return True
+        return not _alive(pid)
+
+    def report(self):
+        """Returns totals over every process that used the cache."""
+        rows = list(self._stats.values())
+        hits = sum(r[0] for r in rows)
+        misses = sum(r[1] for r in rows)
+        waits = sum(r[2] for r in rows)
+        return {
+            "processes": len(rows),
+            "computed": misses,
+            "shared_hits": hits,
+            "waited_for_owner": waits,
+            "recomputations_avoided": hits + waits,
+            "entries": len(self._data),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._pending.clear()
+            self._stats.clear()
+
+
+def _alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process there; rely on stale_after
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True     # exists, owned by someone else
+    return True
+
+
+def attach(cache):
+    """Pool initializer: makes every shared_memoize function use `cache`."""
+    global _cache
+    _cache = cache
+
+
+def shared_memoize(func):
+    local = {}
+    name = (func.__module__, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = args + _KWD_MARK + tuple(sorted(kwargs.items())) if kwargs else args
+        value = local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if _cache is None:
+            value = func(*args, **kwargs)
+        else:
+            value = _cache.get_or_compute(name + key, lambda: func(*args, **kwargs))
+        local[key] = value
+        return value
+
+    wrapper.cache = local
+    return wrapper
+
+
+# ---------------------------------------------- demo --------------------------------------------
+# shared counter of real computations, created in __main__ and handed to each
+# worker by _init_worker (under spawn a module-level one would be per process)
+computed = None
+
+
+def _init_worker(counter, cache=None):
+    global computed
+    computed = counter
+    if cache is not None:
+        attach(cache)
+
+
+def _count_computation():
+    if computed is None:
+        return
+    with computed.get_lock():
+        computed.value += 1
+
+
+def private_memoize(func):
+    # the memoize() from decorators2.py, without the prints
+    cache = {}
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        if args in cache:
+            return cache[args]
+        result = func(*args)
+        cache[args] = result
+        return result
+    return wrapper
+
+
+@private_memoize
+def slow_square_private(n):
+    _count_computation()
+    time.sleep(0.005)
+    return n * n
+
+
+@shared_memoize
+def slow_square(n):
+    _count_computation()
+    time.sleep(0.005)
+    return n * n
+
+
+def _die_while_computing(cache, key):
+    # marks `key` as pending, then exits without clearing the mark
+    cache.get_or_compute(key, lambda: os._exit(1))
+
+
+if __name__ == "__main__":
+    inputs = [i % 50 for i in range(2000)]
+    workers = 4
+
+    computed = multiprocessing.Value("i", 0)
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(computed,)) as pool:
+        pool.map(slow_square_private, inputs, chunksize=25)
+    print("private caches: {} computations in {:.2f}s".format(
+        computed.value, time.perf_counter() - start))
+
+    computed.value = 0
+    cache = SharedCache()
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(computed, cache)) as pool:
+        results = pool.map(slow_square, inputs, chunksize=25)
+    print("shared cache:   {} computations in {:.2f}s".format(
+        computed.value, time.perf_counter() - start))
+    assert results == [i * i for i in inputs]
+    print(cache.report())
+
+    # a worker that dies mid-computation doesn't leave the others waiting forever
+    dying = multiprocessing.Process(target=_die_while_computing, args=(cache, "orphan"))
+    dying.start()
+    dying.join()
+    assert cache.get_or_compute("orphan", lambda: 42) == 42
@@ -0,0 +1,210 @@
+"""
+Bulk temperature conversion.
+
+Temperature.fahrenheit in property1.py converts one value per attribute
+access. Telemetry arrives in batches of tens of millions of readings, and a
+Python object plus a property call per reading is far too slow.
+
+convert(values, "C", "F") converts a whole batch:
+
+    - `values` can be a numpy array, an array('d'), a memoryview, a bytearray
+      of doubles or a plain list
+    - out=... writes into a buffer you already have (same length, float64,
+      contiguous); out=values converts in place, so no new memory at all
+    - the work is done in chunks of `chunk` values with numpy's out= ufuncs,
+      so the only temporary is one small boolean mask per chunk
+
+Units are "C", "F" and "K". Every conversion is y = a * x + b.
+
+Readings below absolute zero (and NaN) are invalid. The check is one
+vectorized comparison per chunk, and on_invalid decides what happens:
+    "raise"  -> ValueError before anything is written (default)
+    "nan"    -> those outputs become NaN
+    "ignore" -> no check
+
+    out = np.empty_like(readings)
+    convert(readings, "C", "F", out=out)
+    convert(readings, "C", "K", out=readings)      # in place
+
+Without numpy the same API falls back to a Python loop over the buffer.
+"""
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ABSOLUTE_ZERO = {"C": -273.15, "F": -459.67, "K": 0.0}
+
+# (a, b) so that to = a * from + b
+_FACTORS = {
+    ("C", "F"): (9 / 5, 32.0),
+    ("F", "C"): (5 / 9, -32.0 * 5 / 9),
+    ("C", "K"): (1.0, 273.15),
+    ("K", "C"): (1.0, -273.15),
+    ("F", "K"): (5 / 9, 273.15 - 32.0 * 5 / 9),
+    ("K", "F"): (9 / 5, 32.0 - 273.15 * 9 / 5),
+}
+
+CHUNK = 1 << 20
+
+
+def _factors(src, dst):
+    if src == dst:
+        return 1.0, 0.0
+    try:
+        return _FACTORS[src, dst]
+    except KeyError:
+        raise ValueError("units must be 'C', 'F' or 'K', not {!r} -> {!r}".format(src, dst)) from None
+
+
+def _as_array(values):
+    if isinstance(values, np.ndarray):
+        return values
+    try:
+        view = memoryview(values)
+    except TypeError:
+        return np.asarray(values, dtype=np.float64)
+    if view.format in ("B", "b", "c"):
+        view = view.cast("d")
+    return np.asarray(view)
+
+
+def invalid_mask(values, unit="C"):
+    """True where a reading is below absolute zero or NaN."""
+    x = _as_array(values)
+    # NaN >= anything is False, so one comparison catches both
+    return ~(x >= ABSOLUTE_ZERO[unit])
+
+
+def convert(values, src, dst, out=None, on_invalid="raise", chunk=CHUNK):
+    a, b = _factors(src, dst)
+    if on_invalid not in ("raise", "nan", "ignore"):
+        raise ValueError("on_invalid must be 'raise', 'nan' or 'ignore'")
+    if np is None:
+        return _convert_python(values, src, a, b, out, on_invalid)
+
+    x = _as_array(values)
+    if x.dtype != np.float64:
+        x = x.astype(np.float64)
+    result = out
+    if out is None:
+        result = y = np.empty_like(x)
+    else:
+        y = _as_array(out)
+        if y.shape != x.shape or y.dtype != np.float64 or not y.flags.writeable:
+            raise ValueError("out must be a writable float64 buffer the same size as values")
+        # a list, or a strided view, would be copied and the results written to the copy
+        if not y.flags.c_contiguous or not np.may_share_memory(y, out):
+            raise ValueError("out must be a contiguous buffer (a C-contiguous array, "
+                             "array('d'), ...) so it can be written in place")
+    x, y = x.reshape(-1), y.reshape(-1)
+    zero = ABSOLUTE_ZERO[src]
+    mask = np.empty(min(chunk, len(x)), dtype=bool)
+
+    if on_invalid == "raise":
+        # check everything first, so an error leaves `out` (or `values`) untouched
+        for start in range(0, len(x), chunk):
+            part = x[start:start + chunk]
+            m = mask[:len(part)]
+            np.greater_equal(part, zero, out=m)
+            if not m.all():
+                bad = start + int(np.argmin(m))
+                raise ValueError("reading {} at index {} is below absolute zero ({} {})".format(
+                    x[bad], bad, zero, src))
+
+    for start in range(0, len(x), chunk):
+        part, dest = x[start:start + chunk], y[start:start + chunk]
+        if on_invalid == "nan":
+            m = mask[:len(part)]
+            np.less(part, zero, out=m)
+        np.multiply(part, a, out=dest)
+        np.add(dest, b, out=dest)
+        if on_invalid == "nan":
+            dest[m] = np.nan
+    return result
+
+
+def _convert_python(values, src, a, b, out, on_invalid):
+    try:
+        x = memoryview(values)
+        if x.format in ("B", "b", "c"):
+            x = x.cast("d")
+    except TypeError:
+        x = array("d", values)
+    zero = ABSOLUTE_ZERO[src]
+    if on_invalid == "raise":
+        for i, v in enumerate(x):
+            if not v >= zero:
+                raise ValueError("reading {} at index {} is below absolute zero ({} {})".format(
+                    v, i, zero, src))
+    result = out if out is not None else array("d", bytes(8 * len(x)))
+    y = memoryview(result)
+    if y.format in ("B", "b", "c"):
+        y = y.cast("d")
+    if len(y) != len(x) or y.readonly:
+        raise ValueError("out must be a writable float64 buffer the same size as values")
+    for i, v in enumerate(x):
+        y[i] = math.nan if on_invalid == "nan" and v < zero else a * v + b
+    return result
+
+
+def celsius_to_fahrenheit(values, out=None, on_invalid="raise"):
+    return convert(values, "C", "F", out, on_invalid)
+
+
+def fahrenheit_to_celsius(values, out=None, on_invalid="raise"):
+    return convert(values, "F", "C", out, on_invalid)
+
+
+def celsius_to_kelvin(values, out=None, on_invalid="raise"):
+    return convert(values, "C", "K", out, on_invalid)
+
+
+def kelvin_to_celsius(values, out=None, on_invalid="raise"):
+    return convert(values, "K", "C", out, on_invalid)
+
+
+if __name__ == "__main__":
+    import time
+
+    class Temperature:
+        # property1.py
+        def __init__(self, celsius):
+            self._celsius = celsius
+
+        @property
+        def fahrenheit(self):
+            return (self._celsius * 9/5) + 32
+
+    n = 1000000
+    readings = [20 + (i % 200) / 10 for i in range(n)]
+
+    start = time.perf_counter()
+    old = [Temperature(c).fahrenheit for c in readings]
+    per_object = time.perf_counter() - start
+
+    buffer = array("d", readings)
+    out = array("d", bytes(8 * n))
+    start = time.perf_counter()
+    celsius_to_fahrenheit(buffer, out=out)
+    bulk = time.perf_counter() - start
+    assert max(abs(p - q) for p, q in zip(old, out)) < 1e-9
+
+    print("{} readings (numpy {})".format(n, "on" if np is not None else "off"))
+    print("Temperature(c).fahrenheit: {:>8.1f} ms".format(per_object * 1000))
+    print("convert into out buffer:   {:>8.1f} ms".format(bulk * 1000))
+
+    start = time.perf_counter()
+    convert(buffer, "C", "K", out=buffer)
+    print("in place C -> K:           {:>8.1f} ms".format((time.perf_counter() - start) * 1000))
+
+    bad = array("d", [25.0, -300.0, float("nan"), 0.0])
+    try:
+        celsius_to_fahrenheit(bad)
+    except ValueError as e:
+        print(e)
+    print(list(celsius_to_fahrenheit(bad, on_invalid="nan")))
+    print(list(invalid_mask(bad, "C")) if np is not None else "")
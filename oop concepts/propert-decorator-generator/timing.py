@@ -0,0 +1,300 @@
+"""
+Low overhead timing instead of print-per-call.
+
+The timer / timer_decorator wrappers in decorator1.py, decorators2.py and the
+args kwargs hof notes call time.time() and print on every call. time.time()
+is a wall clock with poor resolution and the print usually costs more than the
+function being measured.
+
+@timed records time.perf_counter_ns() durations into a fixed size log-linear
+histogram per function (no I/O, no allocation on the call path). Percentiles
+are only worked out when you ask for them:
+
+    @timed
+    def work(): ...
+
+    print(report())              # p50 / p90 / p99 / max per function
+    dump("timings.json")         # machine readable snapshot
+
+Each histogram is 16 linear sub-buckets per power of two, so any recorded
+value is off by at most 1/16 (6.25%) and the whole thing is ~1000 ints no
+matter how many calls you record. On `async def` functions the awaited work
+is timed, not just the creation of the coroutine.
+"""
+import functools
+import inspect
+import json
+import threading
+import time
+
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS           # 16 sub-buckets per power of two
+BUCKETS = (64 - SUB_BITS + 1) * SUB_COUNT
+
+
+def bucket_index(value):
+    if value < SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_COUNT + (value >> shift) - SUB_COUNT
+
+
+def bucket_bounds(index):
+    """Returns the [low, high) range of values that land in `index`."""
+    if index < SUB_COUNT:
+        return index, index + 1
+    shift = index // SUB_COUNT - 1
+    low = (SUB_COUNT + index % SUB_COUNT) << shift
+    return low, low + (1 << shift)
+
+
+class Histogram:
+    """Fixed memory log-linear histogram of nanosecond durations."""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        # bucket_index() inlined, this runs on every timed call
+        if value < SUB_COUNT:
+            self.counts[value] += 1
+        else:
+            shift = value.bit_length() - SUB_BITS - 1
+            self.counts[(shift + 1) * SUB_COUNT + (value >> shift) - SUB_COUNT] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other):
+        counts = self.counts
+        for i, c in enumerate(other.counts):
+            if c:
+                counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        rank = max(1, round(self.count * p / 100))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                low, high = bucket_bounds(i)
+                # middle of the bucket, but never outside the real min / max
+                return max(min((low + high - 1) // 2, self.max), self.min)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ns": self.total // self.count if self.count else 0,
+            "min_ns": self.min or 0,
+            "p50_ns": self.percentile(50),
+            "p90_ns": self.percentile(90),
+            "p99_ns": self.percentile(99),
+            "max_ns": self.max,
+        }
+
+
+class FunctionTimer:
+    """Per-thread histograms for one function, merged only when read."""
+
+    def __init__(self, name):
+        self.name = name
+        self._local = threading.local()
+        self._histograms = []
+        self._lock = threading.Lock()
+
+    def histogram(self):
+        # the thread's own histogram, so record() never needs a lock
+        try:
+            return self._local.histogram
+        except AttributeError:
+            h = self._local.histogram = Histogram()
+            with self._lock:
+                self._histograms.append(h)
+            return h
+
+    def merged(self):
+        total = Histogram()
+        with self._lock:
+            histograms = list(self._histograms)
+        for h in histograms:
+            total.merge(h)
+        return total
+
+    def reset(self):
+        with self._lock:
+            for h in self._histograms:
+                h.__init__()
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_timer(name):
+    timer = _registry.get(name)
+    if timer is None:
+        with _registry_lock:
+            timer = _registry.setdefault(name, FunctionTimer(name))
+    return timer
+
+
+def timed(func=None, *, name=None):
+    """Decorator: record how long each call takes, print nothing."""
+    if func is None:
+        return lambda f: timed(f, name=name)
+
+    timer = get_timer(name or "{}.{}".format(func.__module__, func.__qualname__))
+    local = timer._local
+    clock = time.perf_counter_ns
+
+    if inspect.iscoroutinefunction(func):
+        # time the awaited work, not just the creation of the coroutine
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                try:
+                    histogram = local.histogram
+                except AttributeError:
+                    histogram = timer.histogram()
+                histogram.record(elapsed)
+
+        async_wrapper.timer = timer
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = clock() - start
+            try:
+                histogram = local.histogram
+            except AttributeError:
+                histogram = timer.histogram()
+            histogram.record(elapsed)
+
+    wrapper.timer = timer
+    return wrapper
+
+
+def snapshot():
+    """Returns {function name: summary dict} for every timed function."""
+    with _registry_lock:
+        timers = list(_registry.values())
+    return {t.name: t.merged().summary() for t in timers}
+
+
+def dump(path):
+    """Writes snapshot() as JSON to `path`."""
+    data = {"taken_at": time.time(), "functions": snapshot()}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    return data
+
+
+def report():
+    lines = ["{:<40} {:>9} {:>10} {:>10} {:>10} {:>10}".format(
+        "function", "calls", "p50 us", "p90 us", "p99 us", "max us")]
+    for name, s in sorted(snapshot().items()):
+        lines.append("{:<40} {:>9} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+            name[-40:], s["count"], s["p50_ns"] / 1000, s["p90_ns"] / 1000,
+            s["p99_ns"] / 1000, s["max_ns"] / 1000))
+    return "\n".join(lines)
+
+
+def reset():
+    with _registry_lock:
+        for timer in _registry.values():
+            timer.reset()
+
+
+def measure_overhead(calls=200000):
+    """Returns the extra nanoseconds @timed adds to one call."""
+    def noop():
+        pass
+
+    wrapped = timed(noop, name="__overhead__")
+    clock = time.perf_counter_ns
+
+    start = clock()
+    for _ in range(calls):
+        noop()
+    bare = clock() - start
+
+    start = clock()
+    for _ in range(calls):
+        wrapped()
+    instrumented = clock() - start
+
+    with _registry_lock:
+        _registry.pop("__overhead__", None)
+    return (instrumented - bare) / calls
+
+
+if __name__ == "__main__":
+    import contextlib
+    import os
+
+    def timer_decorator(func):
+        # the old wrapper from decorator1.py
+        def wrapper(*args, **kwargs):
+            start_time = time.time()
+            result = func(*args, **kwargs)
+            end_time = time.time()
+            print(f"{func.__name__} took {end_time - start_time:.4f} seconds")
+            return result
+        return wrapper
+
+    def fib(n):
+        return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+    old = timer_decorator(lambda: fib(10))
+    new = timed(lambda: fib(10), name="fib(10)")
+    calls = 20000
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        fib(10)
+    bare = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(calls):
+            old()
+    print_per_call = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        new()
+    histogram = time.perf_counter() - start
+
+    print("bare:           {:.3f}s".format(bare))
+    print("print-per-call: {:.3f}s (printing to os.devnull)".format(print_per_call))
+    print("@timed:         {:.3f}s".format(histogram))
+    print()
+    print(report())
+    print()
+    print("@timed overhead: {:.0f} ns per call".format(measure_overhead()))
+    print(json.dumps(snapshot(), indent=2))
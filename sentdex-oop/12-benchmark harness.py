@@ -0,0 +1,213 @@
+"""
+A benchmark harness to use instead of a single timeit.timeit call.
+
+6-timeit module.py does
+
+    timeit.timeit('''
+    input_list = range(100)
+    def div_by_five(number): ...
+    xyz = (i for i in input_list if div_by_five(i))
+    ''', number=500000)
+
+and that number is misleading twice over:
+    - the timed code also builds the range and defines div_by_five, 500000 times
+    - the generator is created but never run, so the "generator" case doesn't
+      filter anything at all
+and one run gives one number, with no idea how much it moves between runs.
+
+Here every Benchmark has its setup apart from the timed statement (setup runs
+once per repeat, not per loop), and run():
+    1. picks `number` so one repeat takes about `target` seconds (timeit's autorange)
+    2. does `warmup` repeats and throws them away
+    3. does `repeat` more and keeps the time per loop of each
+    4. reports the median and the IQR (middle 50% of the repeats), and counts
+       outliers: repeats more than 1.5 IQR outside the quartiles (Tukey's fences)
+
+Results can be saved as JSON and compared with a saved baseline: a case is a
+regression when its median is more than `threshold` slower than the
+baseline's (10% by default).
+
+    python "12-benchmark harness.py" --json results.json
+    python "12-benchmark harness.py" --save-baseline baseline.json
+    python "12-benchmark harness.py" --baseline baseline.json --threshold 0.05
+
+It exits with status 1 when something regressed, so it can run in CI.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+
+class Benchmark:
+    def __init__(self, name, stmt, setup="pass", repeat=15, warmup=3, number=None, target=0.05):
+        self.name = name
+        self.stmt = stmt
+        self.setup = setup
+        self.repeat = repeat
+        self.warmup = warmup
+        self.number = number
+        self.target = target
+
+
+class Result:
+    def __init__(self, name, number, samples):
+        self.name = name
+        self.number = number
+        self.samples = samples          # seconds per loop, one per repeat
+
+    @property
+    def quartiles(self):
+        if len(self.samples) < 2:
+            value = self.samples[0]
+            return value, value, value
+        return tuple(statistics.quantiles(self.samples, n=4, method="inclusive"))
+
+    @property
+    def median(self):
+        return statistics.median(self.samples)
+
+    @property
+    def iqr(self):
+        q1, _, q3 = self.quartiles
+        return q3 - q1
+
+    def outliers(self):
+        q1, _, q3 = self.quartiles
+        low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        return [s for s in self.samples if s < low or s > high]
+
+    def to_dict(self):
+        q1, median, q3 = self.quartiles
+        return {
+            "number": self.number,
+            "median": median,
+            "q1": q1,
+            "q3": q3,
+            "iqr": q3 - q1,
+            "min": min(self.samples),
+            "max": max(self.samples),
+            "outliers": len(self.outliers()),
+            "samples": self.samples,
+        }
+
+
+def run(benchmark, globals=None):
+    timer = timeit.Timer(benchmark.stmt, benchmark.setup, globals=globals)
+    number = benchmark.number
+    if number is None:
+        # smallest 1, 2, 5, 10, 20, 50... that takes at least `target` seconds
+        number = 1
+        while True:
+            for multiplier in (1, 2, 5):
+                if timer.timeit(number * multiplier) >= benchmark.target:
+                    number *= multiplier
+                    break
+            else:
+                number *= 10
+                continue
+            break
+    for _ in range(benchmark.warmup):
+        timer.timeit(number)
+    samples = [timer.timeit(number) / number for _ in range(benchmark.repeat)]
+    return Result(benchmark.name, number, samples)
+
+
+def run_suite(benchmarks, globals=None, verbose=True):
+    results = {}
+    for benchmark in benchmarks:
+        result = run(benchmark, globals)
+        results[benchmark.name] = result
+        if verbose:
+            outliers = len(result.outliers())
+            print("{:<36} median {:>10}  IQR {:>10}  ({} x {} loops{})".format(
+                benchmark.name, format_time(result.median), format_time(result.iqr),
+                benchmark.repeat, result.number,
+                ", {} outlier(s)".format(outliers) if outliers else ""))
+    return results
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:.3f} {}".format(seconds / scale, unit)
+    return "{:.1f} ns".format(seconds / 1e-9)
+
+
+def save(results, path):
+    document = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {name: result.to_dict() for name, result in results.items()},
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+
+def compare(results, baseline_path, threshold=0.10):
+    """Prints each case against the baseline; returns the names that got slower than allowed."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print("{:<36} (not in baseline)".format(name))
+            continue
+        before = baseline[name]["median"]
+        change = result.median / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION (> {:.0%})".format(threshold)
+        print("{:<36} {:>10} -> {:>10}  {:+.1%}{}".format(
+            name, format_time(before), format_time(result.median), change, flag))
+    return regressions
+
+
+# 6-timeit module.py, with the setup moved out of the timed statement
+SETUP = """
+input_list = range(100)
+def div_by_five(number):
+    if number %5 == 0:
+        return True
+    return False
+"""
+
+TIMEIT_MODULE_CASES = [
+    Benchmark("generator, created only", "xyz = (i for i in input_list if div_by_five(i))", SETUP),
+    Benchmark("generator, consumed", "for i in (i for i in input_list if div_by_five(i)):\n    x = i", SETUP),
+    Benchmark("list comprehension", "xyz = [i for i in input_list if div_by_five(i)]", SETUP),
+    Benchmark("list(generator)", "xyz = list(i for i in input_list if div_by_five(i))", SETUP),
+    Benchmark("old: setup inside the timed code", SETUP + "xyz = [i for i in input_list if div_by_five(i)]"),
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the 6-timeit module.py cases properly.")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--save-baseline", help="write the results here to compare against later")
+    parser.add_argument("--baseline", help="compare against this saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown of the median that counts as a regression (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    for case in TIMEIT_MODULE_CASES:
+        case.repeat = args.repeat
+    results = run_suite(TIMEIT_MODULE_CASES)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            save(results, path)
+    if args.baseline:
+        print()
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,233 @@
+"""
+Measuring the "generators use less memory but are slower" claim.
+
+4-List comprehension and generator expressions.py and
+5-more List comprehension and generator expressions2.py say a list
+comprehension is faster but stores everything in memory, and a generator
+expression is slower but barely uses any. Nothing there measures it.
+
+This script does, for each case below and every size from 10^3 up:
+
+    list / generator                 sum([i for i in range(n)]) vs sum(i for ...)
+    list / generator, filtered       the same with `if i % 5 == 0`
+    nested list / nested generator   sqrt(n) rows of sqrt(n) values, like the
+                                     [[... for j] for i] examples
+
+Every (case, size) runs in its own fresh `python` subprocess, so one case's
+memory can't be reused or counted by the next, and it runs twice:
+    - once plain, for the peak RSS (the most memory the process really took
+      from the OS, minus what it used before starting the case) and the time
+      (the median of several runs when one run is too short to time)
+    - once under tracemalloc, for the peak of Python allocations (tracemalloc
+      slows things down, so its run isn't timed)
+
+Then it prints a table and a time-vs-memory chart (matplotlib if installed,
+text otherwise) and can save everything as JSON.
+
+    python "13-memory benchmarks.py"                    (10^3 .. 10^7)
+    python "13-memory benchmarks.py" --max-exponent 8   (up to 10^8)
+    python "13-memory benchmarks.py" --json memory.json --plot memory.png
+
+List cases that would need more than about half of the free memory are
+skipped instead of crashing the machine (that is the point of generators).
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:      # Windows
+    resource = None
+
+
+def list_comprehension(n):
+    return sum([i for i in range(n)])
+
+
+def generator_expression(n):
+    return sum(i for i in range(n))
+
+
+def list_filtered(n):
+    return sum([i for i in range(n) if i % 5 == 0])
+
+
+def generator_filtered(n):
+    return sum(i for i in range(n) if i % 5 == 0)
+
+
+def nested_list(n):
+    rows = math.isqrt(n)
+    xyz = [[i * rows + j for j in range(rows)] for i in range(rows)]
+    return sum(sum(row) for row in xyz)
+
+
+def nested_generator(n):
+    rows = math.isqrt(n)
+    xyz = ((i * rows + j for j in range(rows)) for i in range(rows))
+    return sum(sum(row) for row in xyz)
+
+
+CASES = {
+    "list": list_comprehension,
+    "generator": generator_expression,
+    "list, filtered": list_filtered,
+    "generator, filtered": generator_filtered,
+    "nested list": nested_list,
+    "nested generator": nested_generator,
+}
+
+# rough bytes per element a list case holds at once: 8 for the pointer, 32 for the int
+_LIST_BYTES_PER_ITEM = {"list": 40, "list, filtered": 8, "nested list": 40}
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024   # bytes on macOS, KiB on Linux
+
+
+def _available_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def child(case, n, mode):
+    """Runs one case in this (fresh) process and prints the measurements as JSON."""
+    func = CASES[case]
+    if mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start()
+        func(n)
+        _, peak = tracemalloc.get_traced_memory()
+        print(json.dumps({"tracemalloc_peak": peak}))
+        return
+    before = _peak_rss()
+    start = time.perf_counter()
+    func(n)
+    times = [time.perf_counter() - start]
+    after = _peak_rss()
+    # small sizes are over in microseconds: repeat them for ~0.2s and take the median
+    while sum(times) < 0.2 and len(times) < 1000:
+        start = time.perf_counter()
+        func(n)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    print(json.dumps({"time": times[len(times) // 2], "runs": len(times),
+                      "rss_peak": None if before is None else after - before}))
+
+
+def measure(case, n):
+    def run(mode):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", case, str(n), mode],
+            check=True, capture_output=True, text=True).stdout
+        return json.loads(output)
+
+    result = {"case": case, "n": n}
+    result.update(run("time"))
+    result.update(run("tracemalloc"))
+    return result
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return "{:.2f} s".format(seconds)
+    if seconds >= 1e-3:
+        return "{:.2f} ms".format(seconds * 1e3)
+    return "{:.1f} us".format(seconds * 1e6)
+
+
+def format_bytes(size):
+    if size is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return "{:.1f} {}".format(size, unit) if unit != "B" else "{} B".format(size)
+        size /= 1024
+
+
+def text_chart(results, width=50):
+    """One bar pair per case at the largest size: time and tracemalloc peak, each scaled to its max."""
+    n = max(r["n"] for r in results)
+    rows = [r for r in results if r["n"] == n]
+    max_time = max(r["time"] for r in rows)
+    max_memory = max(r["tracemalloc_peak"] for r in rows) or 1
+    print("\nn = {:,}: time (#) and memory (=)".format(n))
+    for r in rows:
+        print("{:<20} {:<{w}} {}".format(r["case"], "#" * max(1, round(width * r["time"] / max_time)),
+                                         format_seconds(r["time"]), w=width))
+        print("{:<20} {:<{w}} {}".format("", "=" * max(1, round(width * r["tracemalloc_peak"] / max_memory)),
+                                         format_bytes(r["tracemalloc_peak"]), w=width))
+
+
+def plot(results, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for case in CASES:
+        rows = [r for r in results if r["case"] == case]
+        if rows:
+            ax.plot([r["tracemalloc_peak"] for r in rows], [r["time"] for r in rows], "o-", label=case)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("tracemalloc peak (bytes)")
+    ax.set_ylabel("time (s)")
+    ax.set_title("time vs memory, one point per input size")
+    ax.legend()
+    fig.savefig(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        child(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Time and memory of list vs generator variants.")
+    parser.add_argument("--min-exponent", type=int, default=3)
+    parser.add_argument("--max-exponent", type=int, default=7)
+    parser.add_argument("--json", help="save the measurements to this file")
+    parser.add_argument("--plot", help="save a time vs memory chart here (needs matplotlib)")
+    args = parser.parse_args()
+
+    available = _available_memory()
+    results = []
+    print("{:<20} {:>6} {:>11} {:>14} {:>14}".format("case", "n", "time", "peak RSS", "tracemalloc"))
+    for exponent in range(args.min_exponent, args.max_exponent + 1):
+        n = 10 ** exponent
+        for case in CASES:
+            needed = _LIST_BYTES_PER_ITEM.get(case, 0) * n
+            if available is not None and needed > available / 2:
+                print("{:<20} {:>6} {:>10}".format(case, "10^{}".format(exponent), "skipped (memory)"))
+                continue
+            r = measure(case, n)
+            results.append(r)
+            print("{:<20} {:>6} {:>11} {:>14} {:>14}".format(
+                case, "10^{}".format(exponent), format_seconds(r["time"]),
+                format_bytes(r["rss_peak"]), format_bytes(r["tracemalloc_peak"])))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    if args.plot:
+        try:
+            plot(results, args.plot)
+        except ImportError:
+            print("matplotlib is not installed, showing the text chart instead")
+            args.plot = None
+    if not args.plot and results:
+        text_chart(results)